@@ -104,7 +104,8 @@ class DatabaseHealthChecker:
             unread_count = cursor.fetchone()[0]
             
             # Analyze recent activity (last 24 hours)
-            yesterday = (datetime.now(timezone.utc) - timedelta(days=1)).isoformat()
+            # Timestamps are stored as integer microseconds since the epoch
+            yesterday = int((datetime.now(timezone.utc) - timedelta(days=1)).timestamp() * 1_000_000)
             cursor = conn.execute(
                 "SELECT COUNT(*) FROM messages WHERE timestamp > ?", 
                 (yesterday,)
@@ -199,6 +200,11 @@ class DatabaseHealthChecker:
             # Vacuum database (compact and defragment)
             start_time = time.time()
             conn.execute("VACUUM")
+            # VACUUM may renumber message rowids, which the FTS index is keyed on
+            if conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+            ).fetchone():
+                conn.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
             vacuum_duration = time.time() - start_time
             optimization_results["operations"].append({
                 "operation": "vacuum_database",
@@ -226,25 +232,27 @@ class DatabaseHealthChecker:
         """Clean up old messages and data."""
         print(f"🧹 Cleaning up data older than {days_to_keep} days...")
         
-        cutoff_date = (datetime.now(timezone.utc) - timedelta(days=days_to_keep)).isoformat()
+        cutoff = datetime.now(timezone.utc) - timedelta(days=days_to_keep)
+        cutoff_date = cutoff.isoformat()
+        cutoff_us = int(cutoff.timestamp() * 1_000_000)
         
         with sqlite3.connect(self.db_path) as conn:
             # Count messages to be deleted
             cursor = conn.execute(
                 "SELECT COUNT(*) FROM messages WHERE timestamp < ?", 
-                (cutoff_date,)
+                (cutoff_us,)
             )
             messages_to_delete = cursor.fetchone()[0]
             
             # Delete old messages
             cursor = conn.execute(
                 "DELETE FROM messages WHERE timestamp < ?", 
-                (cutoff_date,)
+                (cutoff_us,)
             )
             deleted_messages = cursor.rowcount
             
             # Clean up orphaned agents (no messages in last 90 days)
-            agent_cutoff = (datetime.now(timezone.utc) - timedelta(days=90)).isoformat()
+            agent_cutoff = int((datetime.now(timezone.utc) - timedelta(days=90)).timestamp() * 1_000_000)
             cursor = conn.execute(
                 "DELETE FROM agents WHERE last_seen < ?", 
                 (agent_cutoff,)
@@ -81,7 +81,8 @@ class MailboxMonitor:
                 total_agents = cursor.fetchone()[0]
                 
                 # Recent activity (last hour)
-                hour_ago = (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat()
+                # Timestamps are stored as integer microseconds since the epoch
+                hour_ago = int((datetime.now(timezone.utc) - timedelta(hours=1)).timestamp() * 1_000_000)
                 cursor = conn.execute(
                     "SELECT COUNT(*) FROM messages WHERE timestamp > ?", 
                     (hour_ago,)
@@ -163,7 +164,7 @@ class MailboxMonitor:
                 """, (
                     test_id, "monitor", "test", "Performance Test", 
                     "Test message for monitoring", 
-                    datetime.now(timezone.utc).isoformat(), 
+                    int(time.time() * 1_000_000), 
                     True
                 ))
                 # Clean up test message
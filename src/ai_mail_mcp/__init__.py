@@ -9,7 +9,7 @@ __version__ = "1.0.0"
 __author__ = "TimeLordRaps"
 __email__ = "timelordraps@example.com"
 
-from .models import Message
+from .models import Message, MessageRow
 from .mailbox import MailboxManager
 from .agent import AgentIdentifier
 
@@ -18,6 +18,7 @@ from .agent import AgentIdentifier
 
 __all__ = [
     "Message",
+    "MessageRow",
     "MailboxManager", 
     "AgentIdentifier",
     # "server",  # Commented out until MCP dependencies are available
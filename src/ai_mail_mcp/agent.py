@@ -2,28 +2,47 @@
 Agent identification and naming utilities.
 """
 
+import json
 import logging
 import os
 import re
 import socket
-from typing import Set
-
-try:
-    import psutil
-except ImportError:
-    psutil = None
+from pathlib import Path
+from typing import Optional, Set
 
 from .mailbox import MailboxManager
 
 logger = logging.getLogger(__name__)
 
+# "name-3" -> base "name"; names without a numeric suffix are their own base
+_NUMBERED_NAME = re.compile(r"^(.*?)(?:-\d+)?$")
+# 2-64 of letters, digits, dash, underscore and dot, starting and ending with a
+# letter or digit
+_VALID_NAME = re.compile(r"[a-zA-Z0-9][a-zA-Z0-9\-_.]{0,62}[a-zA-Z0-9]")
+
+
+def _get_psutil():
+    """Import psutil on first use, as only the parent-process probe needs it.
+
+    Returns None when psutil is not installed.
+    """
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil
+
 
 class AgentIdentifier:
     """Manages agent identification and naming."""
     
     @staticmethod
-    def detect_agent_name() -> str:
-        """Attempt to detect the current agent's name from environment and process info."""
+    def detect_agent_name(cache_path: Optional[Path] = None) -> str:
+        """Attempt to detect the current agent's name from environment and process info.
+        
+        With cache_path, the parent-process probe is answered from that file
+        when it was written under the same parent process on the same host.
+        """
         
         # Check environment variables for common agent identifiers
         env_vars = [
@@ -42,6 +61,41 @@ class AgentIdentifier:
                 return AgentIdentifier.sanitize_agent_name(value.strip())
         
         # Try to detect from process information
+        agent_name = AgentIdentifier._detect_from_parent_process(cache_path)
+        if agent_name:
+            return agent_name
+        
+        # Try to get from command line arguments
+        try:
+            import sys
+            for arg in sys.argv:
+                if arg.startswith('--agent-name='):
+                    name = arg.split('=', 1)[1]
+                    return AgentIdentifier.sanitize_agent_name(name)
+                elif arg.startswith('--agent='):
+                    name = arg.split('=', 1)[1]
+                    return AgentIdentifier.sanitize_agent_name(name)
+        except Exception as e:
+            logger.debug(f"Could not detect agent from command line: {e}")
+        
+        # Fallback to hostname-based naming
+        hostname = socket.gethostname()
+        return AgentIdentifier.sanitize_agent_name(f"agent-{hostname}")
+    
+    @staticmethod
+    def _detect_from_parent_process(cache_path: Optional[Path] = None) -> Optional[str]:
+        """Map the parent process to an agent name, or None if it is not recognised."""
+        key = {"ppid": os.getppid(), "hostname": socket.gethostname()}
+        if cache_path:
+            try:
+                cached = json.loads(cache_path.read_text())
+                if cached.get("ppid") == key["ppid"] and cached.get("hostname") == key["hostname"]:
+                    return cached.get("agent_name")
+            except (OSError, ValueError):
+                pass
+        
+        agent_name = None
+        psutil = _get_psutil()
         if psutil:
             try:
                 current_process = psutil.Process()
@@ -63,29 +117,24 @@ class AgentIdentifier:
                         'yarn': 'yarn-agent'
                     }
                     
-                    for process_name, agent_name in agent_mappings.items():
+                    for process_name, mapped_name in agent_mappings.items():
                         if process_name in parent_name:
-                            return agent_name
+                            agent_name = mapped_name
+                            break
                             
             except Exception as e:
                 logger.debug(f"Could not detect agent from process: {e}")
+                # Leave the cache alone so the next start probes again
+                return None
         
-        # Try to get from command line arguments
-        try:
-            import sys
-            for arg in sys.argv:
-                if arg.startswith('--agent-name='):
-                    name = arg.split('=', 1)[1]
-                    return AgentIdentifier.sanitize_agent_name(name)
-                elif arg.startswith('--agent='):
-                    name = arg.split('=', 1)[1]
-                    return AgentIdentifier.sanitize_agent_name(name)
-        except Exception as e:
-            logger.debug(f"Could not detect agent from command line: {e}")
+        if cache_path:
+            try:
+                cache_path.parent.mkdir(parents=True, exist_ok=True)
+                cache_path.write_text(json.dumps({**key, "agent_name": agent_name}))
+            except OSError as e:
+                logger.debug(f"Could not write agent name cache: {e}")
         
-        # Fallback to hostname-based naming
-        hostname = socket.gethostname()
-        return AgentIdentifier.sanitize_agent_name(f"agent-{hostname}")
+        return agent_name
     
     @staticmethod
     def sanitize_agent_name(name: str) -> str:
@@ -124,50 +173,31 @@ class AgentIdentifier:
     
     @staticmethod
     def ensure_unique_name(mailbox: MailboxManager, preferred_name: str) -> str:
-        """Ensure the agent name is unique by adding a suffix if needed."""
-        agents = mailbox.get_agents()
-        existing_names: Set[str] = {agent.name for agent in agents}
-        
-        if preferred_name not in existing_names:
+        """Ensure the agent name is unique by adding a suffix if needed.
+
+        A taken name gets the number after the highest one in use, starting
+        at 2, so a retired name (and any mail still addressed to it) is
+        never handed out again.
+        """
+        if not mailbox.agent_exists(preferred_name):
             return preferred_name
         
-        # Extract base name and find next available number
-        if preferred_name.endswith(tuple(f'-{i}' for i in range(1, 100))):
-            base_name = '-'.join(preferred_name.split('-')[:-1])
-        else:
-            base_name = preferred_name
-        
-        counter = 1
-        while f"{base_name}-{counter}" in existing_names:
-            counter += 1
-            
-        return f"{base_name}-{counter}"
+        # Strip a numeric suffix, then number past every name already in use
+        base_name = _NUMBERED_NAME.match(preferred_name).group(1)
+        prefix = f"{base_name}-"
+        suffixes = [
+            int(name[len(prefix):])
+            for name in mailbox.get_agent_names_with_prefix(prefix)
+            if name[len(prefix):].isdecimal()
+        ]
+        return f"{base_name}-{max(suffixes, default=1) + 1}"
 
     @staticmethod
     def validate_agent_name(name: str) -> bool:
         """Validate that an agent name is acceptable."""
-        if not name or not name.strip():
-            return False
-            
-        name = name.strip()
-        
-        # Check length
-        if len(name) < 2 or len(name) > 64:
-            return False
-            
-        # Check for valid characters (alphanumeric, dash, underscore, dot)
-        if not re.match(r'^[a-zA-Z0-9\-_.]+$', name):
-            return False
-            
-        # Can't start or end with dash/underscore/dot
-        if name.startswith(('-', '_', '.')) or name.endswith(('-', '_', '.')):
-            return False
-            
-        # Must contain at least one letter or number
-        if not re.search(r'[a-zA-Z0-9]', name):
+        if not name:
             return False
-            
-        return True
+        return _VALID_NAME.fullmatch(name.strip()) is not None
 
     @staticmethod
     def suggest_agent_names(base_name: str, existing_names: Set[str], count: int = 5) -> list:
@@ -4,27 +4,374 @@ Mailbox management for AI Mail MCP.
 
 import json
 import logging
+import re
 import sqlite3
-from datetime import datetime, timezone
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
-from .models import Message, AgentInfo
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from .models import Message, MessageRow, AgentInfo, from_epoch_us, to_epoch_us
 
 logger = logging.getLogger(__name__)
 
 
+# Column order matters: _message_row reads full rows by position
+_MESSAGE_COLUMNS = ("id", "sender", "recipient", "subject", "body", "timestamp",
+                    "read", "priority", "tags", "reply_to", "thread_id")
+# What the listing views render; rows are read by name
+_SUMMARY_COLUMNS = ("id", "sender", "recipient", "subject", "body", "timestamp",
+                    "read", "priority", "tags")
+# check_mail listing: the body is cut to a preview inside SQLite
+PREVIEW_LENGTH = 100
+_PREVIEW_COLUMNS = ("id", "sender", "subject", "timestamp", "read", "priority", "tags",
+                    f"substr(body, 1, {PREVIEW_LENGTH}) AS preview",
+                    # length() of the whole body would count every character of it
+                    f"length(substr(body, 1, {PREVIEW_LENGTH + 1})) > {PREVIEW_LENGTH} AS has_more")
+_AGENT_COLUMNS = ("name", "last_seen", "metadata")
+
+# Hot write statements. sqlite3 caches compiled statements by SQL text, so
+# these are built once and every call passes the identical string.
+_INSERT_MESSAGE_SQL = f"""
+    INSERT INTO messages ({', '.join(_MESSAGE_COLUMNS)})
+    VALUES ({', '.join('?' * len(_MESSAGE_COLUMNS))})
+"""
+# Bulk inserts of at least _STAGE_MIN_ROWS rows go through a temp table and
+# reach messages in one INSERT ... SELECT. The FTS triggers flush their index
+# data at the end of every statement, so a statement per row writes a tiny FTS
+# segment per row; one statement writes one.
+_STAGE_MIN_ROWS = 8
+# Position of the encoded tags in a message row
+_TAGS_POSITION = _MESSAGE_COLUMNS.index("tags")
+_STAGE_INSERT_SQL = f"""
+    INSERT INTO temp.message_stage
+    VALUES ({', '.join('?' * len(_MESSAGE_COLUMNS))})
+"""
+_STAGE_COPY_SQL = f"""
+    INSERT INTO messages ({', '.join(_MESSAGE_COLUMNS)})
+    SELECT {', '.join(_MESSAGE_COLUMNS)} FROM temp.message_stage
+"""
+# Each distinct tag name is stored once in tags; message_tags links messages to
+# them, so a tag filter is an index lookup rather than a scan of the tags column
+_TAG_INSERT_SQL = "INSERT OR IGNORE INTO tags (name) VALUES (?)"
+_MESSAGE_TAG_INSERT_SQL = """
+    INSERT OR IGNORE INTO message_tags (tag_id, message_id)
+    SELECT id, ? FROM tags WHERE name = ?
+"""
+# An upsert updates a returning agent's row in place (SQLite 3.24+); INSERT OR
+# REPLACE would delete it and insert a new one
+_REGISTER_AGENT_SQL = """
+    INSERT INTO agents (name, last_seen, metadata)
+    VALUES (?, ?, ?)
+    ON CONFLICT(name) DO UPDATE SET last_seen = excluded.last_seen, metadata = excluded.metadata
+"""
+_HEARTBEAT_SQL = "UPDATE agents SET last_seen = ? WHERE name = ?"
+# Seconds between heartbeat flushes; see MailboxManager.heartbeat
+HEARTBEAT_INTERVAL = 5.0
+_MARK_READ_SQL = "UPDATE messages SET read = TRUE WHERE id IN ({}) AND recipient = ?"
+_DELETE_SQL = "DELETE FROM messages WHERE id IN ({}) AND recipient = ?"
+# ID lists are padded up to one of these sizes so the IN (...) text repeats;
+# longer lists are split into chunks of the largest size
+_ID_BUCKETS = (1, 8, 64, 500)
+# get_messages() results kept per reading thread, least recently used dropped first
+_MESSAGES_CACHE_SIZE = 256
+_ID_LIST_SQL = {
+    (template, size): template.format(", ".join("?" * size))
+    for template in (_MARK_READ_SQL, _DELETE_SQL)
+    for size in _ID_BUCKETS
+}
+# The read queries, likewise built once per column set
+_GET_MESSAGE_SQL = f"SELECT {', '.join(_MESSAGE_COLUMNS)} FROM messages WHERE id = ? AND recipient = ? LIMIT 1"
+_INBOX_SQL = {
+    (columns, unread_only): (
+        f"SELECT {', '.join(columns)} FROM messages WHERE recipient = ?"
+        + (" AND read = FALSE" if unread_only else "")
+        + " ORDER BY timestamp DESC LIMIT ?"
+    )
+    for columns in (_MESSAGE_COLUMNS, _SUMMARY_COLUMNS, _PREVIEW_COLUMNS)
+    for unread_only in (False, True)
+}
+_TAGGED_INBOX_SQL = {
+    (columns, unread_only): (
+        f"SELECT {', '.join(columns)} FROM messages WHERE recipient = ?"
+        + (" AND read = FALSE" if unread_only else "")
+        + " AND id IN (SELECT message_id FROM message_tags"
+          " WHERE tag_id = (SELECT id FROM tags WHERE name = ?))"
+        + " ORDER BY timestamp DESC LIMIT ?"
+    )
+    for columns in (_MESSAGE_COLUMNS, _SUMMARY_COLUMNS, _PREVIEW_COLUMNS)
+    for unread_only in (False, True)
+}
+_THREAD_SQL = {
+    columns: f"""
+        SELECT {', '.join(columns)}
+        FROM messages
+        WHERE thread_id = ? AND (sender = ? OR recipient = ?)
+        ORDER BY timestamp ASC
+    """
+    for columns in (_MESSAGE_COLUMNS, _SUMMARY_COLUMNS)
+}
+# One statement for get_message_stats. The received side is counted from the
+# covering (recipient, read, timestamp) index; the sent side skips messages to
+# self, already counted as received, so recent activity counts each message once.
+_AGENT_STATS_SQL = """
+    SELECT r.received, r.unread, s.sent, r.recent + s.recent
+    FROM (SELECT COUNT(*) AS received,
+                 COALESCE(SUM(NOT read), 0) AS unread,
+                 COALESCE(SUM(timestamp > :since), 0) AS recent
+          FROM messages WHERE recipient = :agent) AS r,
+         (SELECT COUNT(*) AS sent,
+                 COALESCE(SUM(timestamp > :since AND recipient != :agent), 0) AS recent
+          FROM messages WHERE sender = :agent) AS s
+"""
+# Columns that older databases stored as ISO-8601 text
+_EPOCH_COLUMNS = (("messages", _MESSAGE_COLUMNS, "timestamp"),
+                  ("agents", _AGENT_COLUMNS, "last_seen"))
+
+
+# Tags are stored wrapped in and separated by this control character, e.g.
+# "\x1furgent\x1ftask\x1f", so one tag can be matched with LIKE '%\x1ftag\x1f%'
+TAG_SEPARATOR = "\x1f"
+# PRAGMA user_version from which the tags column uses TAG_SEPARATOR, not JSON
+_DELIMITED_TAGS_VERSION = 1
+# PRAGMA user_version from which every tagged message is linked in message_tags
+_TAG_INDEX_VERSION = 2
+# PRAGMA user_version once every table, index and trigger _init_db creates
+# exists; opening such a database skips the DDL. Bump it with any schema change.
+_SCHEMA_VERSION = 3
+
+
+def encode_tags(tags: List[str]) -> str:
+    """Encode tags for the tags column; the separator is dropped from tag text."""
+    if not tags:
+        return ""
+    tags = [tag.replace(TAG_SEPARATOR, "") for tag in tags]
+    return TAG_SEPARATOR + TAG_SEPARATOR.join(tags) + TAG_SEPARATOR
+
+
+def decode_tags(raw: Optional[str]) -> List[str]:
+    """Decode the tags column of a raw message row."""
+    return raw[1:-1].split(TAG_SEPARATOR) if raw else []
+
+
+def _dump_metadata(metadata: Dict) -> str:
+    """Serialize agent metadata, with orjson when it is installed."""
+    if orjson is not None:
+        # Non-string keys are stringified, as json.dumps does
+        return orjson.dumps(metadata, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(metadata)
+
+
+def _load_metadata(raw: Optional[str]) -> Dict:
+    if not raw:
+        return {}
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def _message_row(cursor, row) -> MessageRow:
+    """Build a MessageRow from a _MESSAGE_COLUMNS row; doubles as a cursor row_factory."""
+    return MessageRow(
+        row[0], row[1], row[2], row[3], row[4],
+        from_epoch_us(row[5]),
+        bool(row[6]),
+        row[7],
+        tuple(decode_tags(row[8])),
+        row[9],
+        row[10]
+    )
+
+
+def _id_list_sql(template: str, message_ids: List[str]) -> Tuple[str, List[str]]:
+    """Fill an ``IN ({})`` template for message_ids, padding to a cached bucket size.
+
+    Padding repeats the last ID, which leaves the matched rows unchanged.
+    """
+    count = len(message_ids)
+    for size in _ID_BUCKETS:
+        if count <= size:
+            padded = list(message_ids) + [message_ids[-1]] * (size - count)
+            return _ID_LIST_SQL[template, size], padded
+    return template.format(", ".join("?" * count)), list(message_ids)
+
+
+def _iso_to_epoch_us(value):
+    """SQL function used by the migration; leaves already-converted values alone."""
+    if isinstance(value, str):
+        return to_epoch_us(datetime.fromisoformat(value))
+    return value
+
+
+def _fts_query(text: str) -> str:
+    """Turn free text into an FTS5 query: every term quoted and prefix-matched."""
+    return " ".join('"{}"*'.format(term.replace('"', '""')) for term in text.split())
+
+
 class MailboxManager:
     """Manages the SQLite database for storing messages."""
     
-    def __init__(self, db_path: Path):
-        self.db_path = db_path
-        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+    def __init__(self, db_path: Path, read_connections: bool = True):
+        self.db_path = Path(db_path)
+        # ":memory:" gives a private in-memory database, e.g. for tests
+        self._in_memory = str(db_path) == ":memory:"
+        if not self._in_memory:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._fts_enabled = False
+
+        # One long-lived write connection shared by every thread under self._lock,
+        # which doubles as the write mutex. Autocommit mode: each statement is its
+        # own transaction unless a method opens one explicitly. Queries go to a
+        # read-only connection per thread (see _reader), which WAL lets run
+        # alongside the writer and each other.
+        self._lock = threading.RLock()
+        # timeout is SQLite's busy timeout: how long to wait out another
+        # process's write lock before failing with "database is locked"
+        self.db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None,
+                                  cached_statements=256, timeout=30.0)
+        self.db.row_factory = sqlite3.Row
+        # Thread currently inside transaction(), whose reads must see its writes
+        self._transaction_thread: Optional[int] = None
         self._init_db()
+
+        # Each reading thread opens its own reader on first use and keeps it in
+        # _local. _readers tracks them all so close() (and threads that have
+        # exited) can be cleaned up; None means read through the write
+        # connection, as a private in-memory database cannot be opened twice.
+        self._local = threading.local()
+        self._readers: Optional[Dict[threading.Thread, sqlite3.Connection]] = None
+        self._readers_lock = threading.Lock()
+        if not self._in_memory and read_connections:
+            self._readers = {}
+
+        # get_agents() cache. _agents_version is bumped by our own writes; other
+        # processes' writes are caught through PRAGMA data_version, which only
+        # reports commits made by other connections.
+        self._agents_version = 0
+        self._agents_cache_version = -1
+        self._agents_cache: List[AgentInfo] = []
+        self._agent_names: Optional[frozenset] = None
+        self._agents_fingerprint = None
+        self._data_version = None
+
+        # unread_count() cache: per-recipient unread totals, seeded by one grouped
+        # query and kept current by our own sends. Anything it cannot follow
+        # exactly (mark/delete, rollbacks, other connections) drops it for a reseed.
+        self._unread_counts: Optional[Dict[str, int]] = None
+        self._unread_data_version = None
+
+        # get_messages() cache, one per reading thread in _local. Entries are
+        # stamped with _messages_version, bumped by our own writes to messages,
+        # and the reading connection's PRAGMA data_version, which moves with
+        # every commit by any other connection (our writer included).
+        self._messages_version = 0
+
+        # heartbeat() only records the time here; a background thread writes
+        # the latest one per agent every HEARTBEAT_INTERVAL seconds
+        self._heartbeat_lock = threading.Lock()
+        self._pending_heartbeats: Dict[str, int] = {}
+        self._heartbeat_thread: Optional[threading.Thread] = None
+        self._heartbeat_stop = threading.Event()
         
+    def __enter__(self) -> "MailboxManager":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the write connection and every per-thread read connection. Safe to repeat.
+
+        Stops the heartbeat thread first and writes any heartbeats still pending.
+        """
+        self._heartbeat_stop.set()
+        with self._heartbeat_lock:
+            thread = self._heartbeat_thread
+        if thread is not None and thread is not threading.current_thread():
+            # It may be mid-flush; let it finish before the connection goes away
+            thread.join()
+        try:
+            self.flush_heartbeats()
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to flush agent heartbeats: {e}")
+        with self._lock:
+            with self._readers_lock:
+                readers, self._readers = self._readers, None
+            # Threads keep their closed reader, and new ones fall back to the
+            # closed write connection, so later queries fail loudly
+            for conn in (readers or {}).values():
+                conn.close()
+            self.db.close()
+
+    def _open_reader(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(f"{self.db_path.resolve().as_uri()}?mode=ro", uri=True,
+                               check_same_thread=False, isolation_level=None,
+                               cached_statements=256, timeout=30.0)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA mmap_size = 268435456")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    @contextmanager
+    def _reader(self):
+        """A connection for read-only queries, private to the calling thread.
+
+        Inside a transaction() the write connection is used instead, under the
+        lock, so the transaction sees its own uncommitted writes.
+        """
+        if self._readers is None or self._transaction_thread == threading.get_ident():
+            with self._lock:
+                yield self.db
+            return
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._add_reader()
+        yield conn
+
+    def _add_reader(self) -> sqlite3.Connection:
+        """Open the calling thread's reader, closing those of threads that have exited."""
+        conn = self._open_reader()
+        with self._readers_lock:
+            if self._readers is None:
+                conn.close()
+                raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+            for thread in [t for t in self._readers if not t.is_alive()]:
+                self._readers.pop(thread).close()
+            self._readers[threading.current_thread()] = conn
+        return conn
+
     def _init_db(self):
         """Initialize the SQLite database."""
-        with sqlite3.connect(self.db_path) as conn:
+        conn = self.db
+        with self._lock:
+            if not self._in_memory:
+                # An in-memory database has no file to log or map
+                conn.execute("PRAGMA journal_mode = WAL")
+                conn.execute("PRAGMA synchronous = NORMAL")
+                # Serve reads from a memory map; per-connection, which is why it
+                # pays off on the shared one
+                conn.execute("PRAGMA mmap_size = 268435456")
+            conn.execute("PRAGMA temp_store = MEMORY")
+            # Keep up to 64 MiB of pages cached
+            conn.execute("PRAGMA cache_size = -65536")
+            # Private to this connection; see _insert_messages
+            conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS message_stage ({', '.join(_MESSAGE_COLUMNS)})")
+
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= _SCHEMA_VERSION:
+                # Only recorded once the FTS index exists too, see below
+                self._fts_enabled = True
+                return
+
+            legacy = self._legacy_text_timestamps(conn)
+            if legacy:
+                conn.execute("BEGIN")
+                for table in legacy:
+                    conn.execute(f"ALTER TABLE {table} RENAME TO {table}_iso")
+
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS messages (
                     id TEXT PRIMARY KEY,
@@ -32,10 +379,10 @@ class MailboxManager:
                     recipient TEXT NOT NULL,
                     subject TEXT NOT NULL,
                     body TEXT NOT NULL,
-                    timestamp TEXT NOT NULL,
+                    timestamp INTEGER NOT NULL,  -- microseconds since the epoch, UTC
                     read BOOLEAN DEFAULT FALSE,
                     priority TEXT DEFAULT 'normal',
-                    tags TEXT,  -- JSON array of tags
+                    tags TEXT,  -- TAG_SEPARATOR-delimited, see encode_tags
                     reply_to TEXT,
                     thread_id TEXT
                 )
@@ -44,139 +391,609 @@ class MailboxManager:
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS agents (
                     name TEXT PRIMARY KEY,
-                    last_seen TEXT NOT NULL,
+                    last_seen INTEGER NOT NULL,  -- microseconds since the epoch, UTC
                     metadata TEXT  -- JSON metadata about the agent
                 )
             """)
-            
-            # Create indexes for performance
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_recipient ON messages(recipient)")
+
+            if legacy:
+                self._copy_with_epoch_timestamps(conn, legacy)
+                conn.execute("COMMIT")
+
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tags (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS message_tags (
+                    tag_id INTEGER NOT NULL,
+                    message_id TEXT NOT NULL,
+                    PRIMARY KEY (tag_id, message_id)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_message_tags_message ON message_tags(message_id)")
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS message_tags_delete AFTER DELETE ON messages BEGIN
+                    DELETE FROM message_tags WHERE message_id = old.id;
+                END
+            """)
+
+            if conn.execute("PRAGMA user_version").fetchone()[0] < _DELIMITED_TAGS_VERSION:
+                self._convert_json_tags(conn)
+            if conn.execute("PRAGMA user_version").fetchone()[0] < _TAG_INDEX_VERSION:
+                self._link_existing_tags(conn)
+
+            # Create indexes for performance. check_mail's recipient/read filter and
+            # get_thread's ordering are served straight from the composite indexes;
+            # listing all of a recipient's messages newest first needs its own, or
+            # SQLite sorts every one of them to return the first page.
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_recipient_read_ts ON messages(recipient, read, timestamp DESC)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_recipient_ts ON messages(recipient, timestamp DESC)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_sender ON messages(sender)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_timestamp ON messages(timestamp)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_thread ON messages(thread_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_thread_ts ON messages(thread_id, timestamp)")
+            # Superseded by the composite indexes above, whose prefixes they were
+            conn.execute("DROP INDEX IF EXISTS idx_recipient")
+            conn.execute("DROP INDEX IF EXISTS idx_thread")
+
+            self._init_fts(conn, rebuild="messages" in legacy)
+            if self._fts_enabled:
+                # Without FTS5 the DDL runs on every open, so the index is
+                # built once a SQLite that has it opens the database
+                conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+
+    @staticmethod
+    def _legacy_text_timestamps(conn: sqlite3.Connection) -> List[str]:
+        """Tables whose timestamp column still has the old TEXT declaration."""
+        legacy = []
+        for table, _, column in _EPOCH_COLUMNS:
+            for row in conn.execute(f"PRAGMA table_info({table})"):
+                if row[1] == column and row[2].upper() == "TEXT":
+                    legacy.append(table)
+        return legacy
+
+    @staticmethod
+    def _copy_with_epoch_timestamps(conn: sqlite3.Connection, tables: List[str]):
+        """Move rows out of the renamed legacy tables, converting ISO text to integers."""
+        conn.create_function("iso_to_epoch_us", 1, _iso_to_epoch_us)
+        for table, columns, column in _EPOCH_COLUMNS:
+            if table not in tables:
+                continue
+            selected = ", ".join(
+                f"iso_to_epoch_us({name})" if name == column else name for name in columns
+            )
+            conn.execute(f"""
+                INSERT INTO {table} ({', '.join(columns)})
+                SELECT {selected} FROM {table}_iso
+            """)
+            # Takes the old indexes and triggers with it
+            conn.execute(f"DROP TABLE {table}_iso")
+        logger.info(f"Migrated timestamps to epoch microseconds: {', '.join(tables)}")
+
+    @staticmethod
+    def _convert_json_tags(conn: sqlite3.Connection):
+        """Rewrite tags stored as JSON arrays in the delimited format, once per database."""
+        rows = conn.execute("SELECT rowid, tags FROM messages WHERE tags LIKE '[%'").fetchall()
+        conn.execute("BEGIN")
+        conn.executemany(
+            "UPDATE messages SET tags = ? WHERE rowid = ?",
+            [(encode_tags(json.loads(tags)), rowid) for rowid, tags in rows]
+        )
+        conn.execute(f"PRAGMA user_version = {_DELIMITED_TAGS_VERSION}")
+        conn.execute("COMMIT")
+        if rows:
+            logger.info(f"Converted tags of {len(rows)} message(s) from JSON")
+
+    @classmethod
+    def _link_existing_tags(cls, conn: sqlite3.Connection):
+        """Fill message_tags for messages stored before it existed, once per database."""
+        rows = conn.execute("SELECT id, tags FROM messages WHERE tags <> ''").fetchall()
+        conn.execute("BEGIN")
+        cls._link_tags(conn, rows)
+        conn.execute(f"PRAGMA user_version = {_TAG_INDEX_VERSION}")
+        conn.execute("COMMIT")
+        if rows:
+            logger.info(f"Indexed tags of {len(rows)} message(s)")
+
+    @staticmethod
+    def _link_tags(conn: sqlite3.Connection, tagged: Iterable[Tuple[str, str]]):
+        """Record (message ID, encoded tags) pairs in tags/message_tags. Caller is in a transaction."""
+        links = [(message_id, tag) for message_id, raw in tagged for tag in decode_tags(raw)]
+        if not links:
+            return
+        conn.executemany(_TAG_INSERT_SQL, [(tag,) for tag in {tag for _, tag in links}])
+        conn.executemany(_MESSAGE_TAG_INSERT_SQL, links)
+
+    def _init_fts(self, conn: sqlite3.Connection, rebuild: bool = False):
+        """Create the FTS5 index over subject/body and the triggers keeping it in sync."""
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+        ).fetchone()
+        try:
+            conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts
+                USING fts5(subject, body, content='messages', content_rowid='rowid')
+            """)
+        except sqlite3.OperationalError as e:
+            # SQLite built without FTS5; search_messages falls back to a scan
+            logger.warning(f"FTS5 unavailable, message search will scan: {e}")
+            self._fts_enabled = False
+            return
+
+        self._fts_enabled = True
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+                INSERT INTO messages_fts(rowid, subject, body)
+                VALUES (new.rowid, new.subject, new.body);
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+                INSERT INTO messages_fts(messages_fts, rowid, subject, body)
+                VALUES ('delete', old.rowid, old.subject, old.body);
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF subject, body ON messages BEGIN
+                INSERT INTO messages_fts(messages_fts, rowid, subject, body)
+                VALUES ('delete', old.rowid, old.subject, old.body);
+                INSERT INTO messages_fts(rowid, subject, body)
+                VALUES (new.rowid, new.subject, new.body);
+            END
+        """)
+
+        if not exists or rebuild:
+            # Index messages stored before the FTS table existed, or copied by a migration
+            conn.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
             
     def send_message(self, message: Message) -> str:
         """Store a new message in the database."""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                INSERT INTO messages 
-                (id, sender, recipient, subject, body, timestamp, read, priority, tags, reply_to, thread_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                message.id,
-                message.sender,
-                message.recipient,
-                message.subject,
-                message.body,
-                message.timestamp.isoformat(),
-                message.read,
-                message.priority,
-                json.dumps(message.tags),
-                message.reply_to,
-                message.thread_id
-            ))
+        params = self._message_params(message)
+        # Linking tags is a second statement, so tagged messages need a transaction
+        with self.transaction() if message.tags else self._lock:
+            self._messages_version += 1
+            self.db.execute(_INSERT_MESSAGE_SQL, params)
+            self._link_tags(self.db, [(message.id, params[_TAGS_POSITION])])
+            self._count_unread([message])
         return message.id
+
+    def send_messages_bulk(self, messages: Iterable[Message]) -> int:
+        """Store many messages in one transaction; returns how many were stored.
+
+        All or nothing: if any message fails to insert, none are kept.
+        """
+        messages = list(messages)
+        with self.transaction():
+            self._insert_messages([self._message_params(message) for message in messages])
+            self._count_unread(messages)
+        return len(messages)
+
+    def bulk_load(self, messages: Iterable[Message]) -> int:
+        """Like send_messages_bulk, but rebuilds the message indexes once afterwards.
+
+        The indexes are dropped for the load and recreated from their stored
+        DDL, all in the same transaction. Building an index over the whole
+        table is cheaper than updating it row by row only when the load is
+        large next to what is already stored; prefer send_messages_bulk otherwise.
+        """
+        with self.transaction():
+            indexes = self.db.execute(
+                "SELECT name, sql FROM sqlite_master "
+                "WHERE type = 'index' AND tbl_name = 'messages' AND sql IS NOT NULL"
+            ).fetchall()
+            for name, _ in indexes:
+                self.db.execute(f'DROP INDEX "{name}"')
+            count = self.send_messages_bulk(messages)
+            for _, sql in indexes:
+                self.db.execute(sql)
+        return count
+
+    def send_message_rows(self, ids: List[str], senders: List[str], recipients: List[str],
+                          subjects: List[str], bodies: List[str],
+                          timestamps: List[datetime]) -> int:
+        """Store plain unread, normal-priority, untagged messages given column by column.
+
+        A bulk path for callers that already hold the values: no ``Message`` is
+        built or validated, so the caller is responsible for valid input.
+        All or nothing, like send_messages_bulk; returns how many were stored.
+        """
+        no_tags = encode_tags([])
+        rows = [
+            (message_id, sender, recipient, subject, body, to_epoch_us(timestamp),
+             False, "normal", no_tags, None, None)
+            for message_id, sender, recipient, subject, body, timestamp
+            in zip(ids, senders, recipients, subjects, bodies, timestamps)
+        ]
+        with self.transaction():
+            self._insert_messages(rows)
+            if self._unread_counts is not None:
+                for row in rows:
+                    recipient = row[2]
+                    self._unread_counts[recipient] = self._unread_counts.get(recipient, 0) + 1
+        return len(rows)
+
+    def _insert_messages(self, rows: List[tuple]):
+        """Insert message rows, staging large batches. Caller is inside transaction()."""
+        self._messages_version += 1
+        if len(rows) < _STAGE_MIN_ROWS:
+            self.db.executemany(_INSERT_MESSAGE_SQL, rows)
+        else:
+            self.db.executemany(_STAGE_INSERT_SQL, rows)
+            self.db.execute(_STAGE_COPY_SQL)
+            self.db.execute("DELETE FROM temp.message_stage")
+        self._link_tags(self.db, [(row[0], row[_TAGS_POSITION]) for row in rows])
+
+    @staticmethod
+    def _message_params(message: Message) -> tuple:
+        return (
+            message.id,
+            message.sender,
+            message.recipient,
+            message.subject,
+            message.body,
+            to_epoch_us(message.timestamp),
+            message.read,
+            message.priority,
+            encode_tags(message.tags),
+            message.reply_to,
+            message.thread_id
+        )
+
+    def _count_unread(self, messages: List[Message]):
+        """Add newly stored messages to the unread-count cache. Caller holds _lock."""
+        if self._unread_counts is None:
+            return
+        for message in messages:
+            if not message.read:
+                self._unread_counts[message.recipient] = self._unread_counts.get(message.recipient, 0) + 1
     
-    def get_messages(self, recipient: str, unread_only: bool = False, limit: int = 50) -> List[Message]:
-        """Retrieve messages for a specific recipient."""
-        with sqlite3.connect(self.db_path) as conn:
-            query = """
-                SELECT id, sender, recipient, subject, body, timestamp, read, priority, tags, reply_to, thread_id
-                FROM messages 
-                WHERE recipient = ?
+    def get_messages(self, recipient: str, unread_only: bool = False, limit: int = 50) -> List[MessageRow]:
+        """Retrieve messages for a specific recipient.
+
+        Repeating a call returns the rows read last time until any message is
+        written, here or through another connection. The rows are immutable,
+        tags included, so sharing them between those calls is safe.
+        """
+        key = (recipient, bool(unread_only), limit)
+        with self._reader() as conn:
+            # Taken before querying: a write that lands in between leaves the
+            # entry stamped as older than its rows, which is only a wasted miss
+            stamp = (self._messages_version, conn.execute("PRAGMA data_version").fetchone()[0])
+            cache = getattr(self._local, "messages", None)
+            if cache is None or cache[0] != stamp:
+                cache = self._local.messages = (stamp, {})
+            entries = cache[1]
+            rows = entries.pop(key, None)
+            if rows is None:
+                cursor = conn.execute(*self._inbox_query(_MESSAGE_COLUMNS, recipient, unread_only, limit))
+                cursor.row_factory = _message_row
+                rows = cursor.fetchall()
+                if len(entries) >= _MESSAGES_CACHE_SIZE:
+                    del entries[next(iter(entries))]
+            # Reinserted so the dict stays in least-recently-used order
+            entries[key] = rows
+        return list(rows)
+
+    def iter_messages(self, recipient: str, unread_only: bool = False,
+                      limit: int = 50) -> Iterator[MessageRow]:
+        """Like get_messages, but builds each ``MessageRow`` only when it is consumed.
+
+        The rows are fetched up front so the database lock is not held while
+        the caller iterates; stopping early skips hydrating the rest.
+        """
+        rows = self._fetch(*self._inbox_query(_MESSAGE_COLUMNS, recipient, unread_only, limit))
+        return (_message_row(None, row) for row in rows)
+
+    def get_message_by_id(self, message_id: str, recipient: str) -> Optional[MessageRow]:
+        """Fetch one of a recipient's messages by ID, or None if there is no such message."""
+        rows = self._fetch(
+            _GET_MESSAGE_SQL,
+            (message_id, recipient),
+            row_factory=_message_row
+        )
+        return rows[0] if rows else None
+
+    def fetch_message_summaries(self, recipient: str, unread_only: bool = False,
+                                limit: int = 50) -> List[sqlite3.Row]:
+        """Like get_messages, but returns raw ``sqlite3.Row`` objects for listing.
+
+        Timestamps stay integer epoch microseconds (see ``from_epoch_us``) and
+        tags stay encoded; use ``decode_tags`` on the rows that actually need them.
+        """
+        return self._fetch(*self._inbox_query(_SUMMARY_COLUMNS, recipient, unread_only, limit))
+
+    def get_message_previews(self, recipient: str, unread_only: bool = False,
+                             limit: int = 50, tag: Optional[str] = None) -> List[sqlite3.Row]:
+        """Like fetch_message_summaries, but with only a short preview of each body.
+
+        Rows have ``preview`` (the first PREVIEW_LENGTH characters) and
+        ``has_more`` instead of ``body``, so large bodies never leave SQLite.
+        With ``tag``, only messages carrying that tag are listed.
+        """
+        return self._fetch(*self._inbox_query(_PREVIEW_COLUMNS, recipient, unread_only, limit, tag))
+
+    @staticmethod
+    def _inbox_query(columns: Tuple[str, ...], recipient: str, unread_only: bool, limit: int,
+                     tag: Optional[str] = None):
+        if tag is not None:
+            return _TAGGED_INBOX_SQL[columns, bool(unread_only)], (recipient, tag, limit)
+        return _INBOX_SQL[columns, bool(unread_only)], (recipient, limit)
+
+    def search_messages(self, recipient: str, query: str, sender: Optional[str] = None,
+                        since: Optional[datetime] = None, limit: int = 10) -> List[MessageRow]:
+        """Search a recipient's messages by subject and body, best matches first."""
+        rows = self._search(_MESSAGE_COLUMNS, recipient, query, sender, since, limit)
+        return [_message_row(None, row) for row in rows]
+
+    def search_message_summaries(self, recipient: str, query: str, sender: Optional[str] = None,
+                                 since: Optional[datetime] = None, limit: int = 10) -> List[sqlite3.Row]:
+        """Like search_messages, but returns raw ``sqlite3.Row`` objects.
+
+        Rows carry an extra ``context`` column: an excerpt of the subject or body around
+        the match, or None when SQLite has no FTS5 and the caller must find it.
+        """
+        return self._search(_SUMMARY_COLUMNS, recipient, query, sender, since, limit, with_context=True)
+
+    def _search(self, columns: Tuple[str, ...], recipient: str, query: str,
+                sender: Optional[str], since: Optional[datetime], limit: int,
+                with_context: bool = False) -> List[sqlite3.Row]:
+        selected = ", ".join("m." + column for column in columns)
+        if with_context:
+            # FTS5 cuts the best-matching excerpt while it has the match at hand
+            selected += (", snippet(messages_fts, -1, '', '', '...', 16) AS context"
+                         if self._fts_enabled else ", NULL AS context")
+        if self._fts_enabled:
+            match = _fts_query(query)
+            if not match:
+                return []
+            sql = f"""
+                SELECT {selected}
+                FROM messages_fts
+                JOIN messages m ON m.rowid = messages_fts.rowid
+                WHERE messages_fts MATCH ? AND m.recipient = ?
             """
+            params = [match, recipient]
+        else:
+            # No FTS5 in this SQLite build: filter in SQL, match substrings in Python
+            sql = f"SELECT {selected} FROM messages m WHERE m.recipient = ?"
             params = [recipient]
-            
-            if unread_only:
-                query += " AND read = FALSE"
-                
-            query += " ORDER BY timestamp DESC LIMIT ?"
+
+        if sender:
+            sql += " AND m.sender = ?"
+            params.append(sender)
+        if since:
+            sql += " AND m.timestamp >= ?"
+            params.append(to_epoch_us(since))
+
+        if self._fts_enabled:
+            sql += " ORDER BY bm25(messages_fts) LIMIT ?"
             params.append(limit)
-            
-            cursor = conn.execute(query, params)
-            messages = []
-            
-            for row in cursor.fetchall():
-                messages.append(Message(
-                    id=row[0],
-                    sender=row[1],
-                    recipient=row[2],
-                    subject=row[3],
-                    body=row[4],
-                    timestamp=datetime.fromisoformat(row[5]),
-                    read=bool(row[6]),
-                    priority=row[7],
-                    tags=json.loads(row[8]) if row[8] else [],
-                    reply_to=row[9],
-                    thread_id=row[10]
-                ))
-                
-        return messages
-    
+            return self._fetch(sql, params)
+
+        sql += " ORDER BY m.timestamp DESC LIMIT 1000"
+        # Case-insensitive match without building lowercased copies of every body
+        pattern = re.compile(re.escape(query), re.IGNORECASE)
+        matches = []
+        for row in self._fetch(sql, params):
+            if pattern.search(row["subject"]) or (row["body"] and pattern.search(row["body"])):
+                matches.append(row)
+                if len(matches) >= limit:
+                    break
+        return matches
+
+    def _fetch(self, sql: str, params, row_factory=None) -> list:
+        """Run a query and fetch every row, as ``sqlite3.Row`` unless row_factory is given.
+
+        A row_factory such as _message_row builds results while SQLite steps the
+        cursor, skipping the intermediate ``sqlite3.Row`` objects.
+        """
+        with self._reader() as conn:
+            cursor = conn.execute(sql, params)
+            if row_factory is not None:
+                # Rows are built as they are fetched, so this still applies to all of them
+                cursor.row_factory = row_factory
+            return cursor.fetchall()
+
+    @contextmanager
+    def transaction(self):
+        """Run a block of statements as one write transaction.
+
+        Takes the write lock up front (BEGIN IMMEDIATE), commits on success and
+        rolls back on error. Nested use joins the outer transaction.
+        """
+        with self._lock:
+            if self.db.in_transaction:
+                yield self.db
+                return
+            self.db.execute("BEGIN IMMEDIATE")
+            self._transaction_thread = threading.get_ident()
+            try:
+                yield self.db
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                self._unread_counts = None
+                self._messages_version += 1
+                raise
+            else:
+                self.db.execute("COMMIT")
+            finally:
+                self._transaction_thread = None
+
     def mark_as_read(self, message_ids: List[str], recipient: str) -> int:
         """Mark messages as read for a specific recipient."""
-        with sqlite3.connect(self.db_path) as conn:
-            placeholders = ','.join(['?' for _ in message_ids])
-            cursor = conn.execute(f"""
-                UPDATE messages 
-                SET read = TRUE 
-                WHERE id IN ({placeholders}) AND recipient = ?
-            """, message_ids + [recipient])
-            return cursor.rowcount
+        return self._execute_for_ids(_MARK_READ_SQL, message_ids, recipient)
     
     def delete_messages(self, message_ids: List[str], recipient: str) -> int:
         """Delete messages for a specific recipient."""
-        with sqlite3.connect(self.db_path) as conn:
-            placeholders = ','.join(['?' for _ in message_ids])
-            cursor = conn.execute(f"""
-                DELETE FROM messages 
-                WHERE id IN ({placeholders}) AND recipient = ?
-            """, message_ids + [recipient])
-            return cursor.rowcount
+        return self._execute_for_ids(_DELETE_SQL, message_ids, recipient)
+
+    def _execute_for_ids(self, template: str, message_ids: List[str], recipient: str) -> int:
+        """Apply an ``IN ({})`` statement to message_ids in chunks, in one transaction."""
+        if not message_ids:
+            return 0
+        chunk = _ID_BUCKETS[-1]
+        count = 0
+        with self.transaction():
+            self._messages_version += 1
+            for start in range(0, len(message_ids), chunk):
+                sql, ids = _id_list_sql(template, message_ids[start:start + chunk])
+                count += self.db.execute(sql, ids + [recipient]).rowcount
+            # rowcount includes messages that were already read, so reseed
+            # instead; cleared here, under the lock, so unread_count cannot
+            # cache the counts from before these writes
+            self._unread_counts = None
+        return count
     
-    def get_thread(self, thread_id: str, agent_name: str) -> List[Message]:
+    def unread_count(self, recipient: str) -> int:
+        """Number of unread messages for recipient, answered from memory when possible."""
+        with self._lock:
+            data_version = self.db.execute("PRAGMA data_version").fetchone()[0]
+            if self._unread_counts is None or data_version != self._unread_data_version:
+                self._unread_counts = dict(self.db.execute(
+                    "SELECT recipient, COUNT(*) FROM messages WHERE read = FALSE GROUP BY recipient"
+                ).fetchall())
+                self._unread_data_version = data_version
+            return self._unread_counts.get(recipient, 0)
+
+    def get_thread(self, thread_id: str, agent_name: str) -> List[MessageRow]:
         """Get all messages in a thread that involve the agent."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute("""
-                SELECT id, sender, recipient, subject, body, timestamp, read, priority, tags, reply_to, thread_id
-                FROM messages 
-                WHERE thread_id = ? AND (sender = ? OR recipient = ?)
-                ORDER BY timestamp ASC
-            """, (thread_id, agent_name, agent_name))
-            
-            messages = []
-            for row in cursor.fetchall():
-                messages.append(Message(
-                    id=row[0],
-                    sender=row[1],
-                    recipient=row[2],
-                    subject=row[3],
-                    body=row[4],
-                    timestamp=datetime.fromisoformat(row[5]),
-                    read=bool(row[6]),
-                    priority=row[7],
-                    tags=json.loads(row[8]) if row[8] else [],
-                    reply_to=row[9],
-                    thread_id=row[10]
-                ))
-                
-        return messages
-    
+        return self._fetch(*self._thread_query(_MESSAGE_COLUMNS, thread_id, agent_name),
+                           row_factory=_message_row)
+
+    def iter_thread(self, thread_id: str, agent_name: str) -> Iterator[MessageRow]:
+        """Like get_thread, but builds each ``MessageRow`` only when it is consumed."""
+        rows = self._fetch(*self._thread_query(_MESSAGE_COLUMNS, thread_id, agent_name))
+        return (_message_row(None, row) for row in rows)
+
+    def get_thread_summaries(self, thread_id: str, agent_name: str) -> List[sqlite3.Row]:
+        """Like get_thread, but returns raw ``sqlite3.Row`` objects."""
+        return self._fetch(*self._thread_query(_SUMMARY_COLUMNS, thread_id, agent_name))
+
+    @staticmethod
+    def _thread_query(columns: Tuple[str, ...], thread_id: str, agent_name: str):
+        return _THREAD_SQL[columns], (thread_id, agent_name, agent_name)
+
     def register_agent(self, agent_name: str, metadata: Optional[Dict] = None):
         """Register an agent and update their last seen time."""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                INSERT OR REPLACE INTO agents (name, last_seen, metadata)
-                VALUES (?, ?, ?)
-            """, (
+        with self._lock:
+            self.db.execute(_REGISTER_AGENT_SQL, (
                 agent_name,
-                datetime.now(timezone.utc).isoformat(),
-                json.dumps(metadata or {})
+                to_epoch_us(datetime.now(timezone.utc)),
+                _dump_metadata(metadata or {})
             ))
-    
+            self._agents_version += 1
+
+    def register_agents(self, agents: Iterable[Tuple[str, Optional[Dict]]]) -> int:
+        """Register several (name, metadata) agents in one transaction; returns how many."""
+        now = to_epoch_us(datetime.now(timezone.utc))
+        rows = [(name, now, _dump_metadata(metadata or {})) for name, metadata in agents]
+        with self.transaction():
+            self.db.executemany(_REGISTER_AGENT_SQL, rows)
+            self._agents_version += 1
+        return len(rows)
+
+    def heartbeat(self, agent_name: str):
+        """Note that an agent is active without writing to the database now.
+
+        Heartbeats are coalesced and flushed by a background thread, so this
+        is safe to call on every request.
+        """
+        now = to_epoch_us(datetime.now(timezone.utc))
+        with self._heartbeat_lock:
+            self._pending_heartbeats[agent_name] = now
+            if self._heartbeat_thread is None:
+                self._heartbeat_thread = threading.Thread(
+                    target=self._heartbeat_loop, name="ai-mail-heartbeat", daemon=True
+                )
+                self._heartbeat_thread.start()
+
+    def flush_heartbeats(self) -> int:
+        """Write pending heartbeats in one transaction; returns how many were written."""
+        with self._heartbeat_lock:
+            pending, self._pending_heartbeats = self._pending_heartbeats, {}
+        if not pending:
+            return 0
+        try:
+            with self.transaction():
+                self.db.executemany(_HEARTBEAT_SQL, [(ts, name) for name, ts in pending.items()])
+                self._agents_version += 1
+        except sqlite3.Error:
+            # Keep them for the next flush unless a newer heartbeat came in
+            with self._heartbeat_lock:
+                for name, ts in pending.items():
+                    self._pending_heartbeats.setdefault(name, ts)
+            raise
+        return len(pending)
+
+    def _heartbeat_loop(self):
+        while not self._heartbeat_stop.wait(HEARTBEAT_INTERVAL):
+            try:
+                self.flush_heartbeats()
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to flush agent heartbeats: {e}")
+
     def get_agents(self) -> List[AgentInfo]:
         """Get list of all registered agents."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._lock:
+            self._refresh_agents()
+            return list(self._agents_cache)
+
+    def agent_exists(self, name: str) -> bool:
+        """Check whether an agent is registered.
+
+        Answered from the cached agent list while it is current; otherwise one
+        primary-key probe, rather than reloading (and decoding) every agent.
+        """
+        with self._lock:
+            self._check_agents_changed()
+            if self._agents_cache_version != self._agents_version:
+                return self.db.execute(
+                    "SELECT 1 FROM agents WHERE name = ? LIMIT 1", (name,)
+                ).fetchone() is not None
+            if self._agent_names is None:
+                self._agent_names = frozenset(agent.name for agent in self._agents_cache)
+            return name in self._agent_names
+
+    def get_agent_names_with_prefix(self, prefix: str) -> List[str]:
+        """Names of registered agents that start with prefix, read off the primary key."""
+        # A half-open range rather than LIKE/GLOB, so prefix needs no escaping
+        rows = self._fetch(
+            "SELECT name FROM agents WHERE name >= ? AND name < ?",
+            (prefix, prefix + "\U0010ffff")
+        )
+        return [row[0] for row in rows]
+
+    def _refresh_agents(self):
+        """Reload the agent cache if it is stale. Caller holds _lock."""
+        self._check_agents_changed()
+        if self._agents_cache_version != self._agents_version:
+            self._agents_cache = self._load_agents()
+            self._agent_names = None
+            self._agents_cache_version = self._agents_version
+
+    def _check_agents_changed(self):
+        """Bump the agents version if another connection changed the agents table.
+
+        PRAGMA data_version is a cheap in-memory check; only when something was
+        committed do we look at the agents table itself. Every registration
+        rewrites last_seen, so the row count plus the newest last_seen changes
+        whenever an agent is added, re-registered or removed.
+        """
+        data_version = self.db.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+        fingerprint = tuple(self.db.execute(
+            "SELECT COUNT(*), MAX(last_seen) FROM agents"
+        ).fetchone())
+        if fingerprint != self._agents_fingerprint:
+            self._agents_fingerprint = fingerprint
+            self._agents_version += 1
+
+    def _load_agents(self) -> List[AgentInfo]:
+        with self._reader() as conn:
             cursor = conn.execute("""
                 SELECT name, last_seen, metadata FROM agents
                 ORDER BY last_seen DESC
@@ -186,48 +1003,39 @@ class MailboxManager:
             for row in cursor.fetchall():
                 agents.append(AgentInfo(
                     name=row[0],
-                    last_seen=datetime.fromisoformat(row[1]),
-                    metadata=json.loads(row[2]) if row[2] else {}
+                    last_seen=from_epoch_us(row[1]),
+                    metadata=_load_metadata(row[2])
                 ))
                 
         return agents
 
     def get_message_stats(self, agent_name: str) -> Dict:
         """Get message statistics for an agent."""
-        with sqlite3.connect(self.db_path) as conn:
-            # Total messages received
-            cursor = conn.execute(
-                "SELECT COUNT(*) FROM messages WHERE recipient = ?", 
-                (agent_name,)
-            )
-            total_received = cursor.fetchone()[0]
-            
-            # Unread messages
-            cursor = conn.execute(
-                "SELECT COUNT(*) FROM messages WHERE recipient = ? AND read = FALSE", 
-                (agent_name,)
-            )
-            unread = cursor.fetchone()[0]
-            
-            # Messages sent
-            cursor = conn.execute(
-                "SELECT COUNT(*) FROM messages WHERE sender = ?", 
-                (agent_name,)
-            )
-            sent = cursor.fetchone()[0]
-            
-            # Recent activity (last 24 hours)
-            from datetime import timedelta
-            yesterday = (datetime.now(timezone.utc) - timedelta(days=1)).isoformat()
-            cursor = conn.execute(
-                "SELECT COUNT(*) FROM messages WHERE (sender = ? OR recipient = ?) AND timestamp > ?", 
-                (agent_name, agent_name, yesterday)
-            )
-            recent_activity = cursor.fetchone()[0]
-            
-            return {
-                "total_received": total_received,
-                "unread": unread,
-                "sent": sent,
-                "recent_activity": recent_activity
-            }
+        since = to_epoch_us(datetime.now(timezone.utc) - timedelta(days=1))
+        with self._reader() as conn:
+            received, unread, sent, recent_activity = conn.execute(
+                _AGENT_STATS_SQL, {"agent": agent_name, "since": since}
+            ).fetchone()
+        return {
+            "total_received": received,
+            "unread": unread,
+            "sent": sent,
+            "recent_activity": recent_activity
+        }
+
+    def get_all_agent_stats(self) -> Dict[str, Dict]:
+        """Get received/unread/sent counts for every agent in two grouped queries."""
+        stats: Dict[str, Dict] = {}
+        with self._reader() as conn:
+            cursor = conn.execute("""
+                SELECT recipient, COUNT(*), SUM(NOT read)
+                FROM messages GROUP BY recipient
+            """)
+            for name, received, unread in cursor.fetchall():
+                stats[name] = {"total_received": received, "unread": unread, "sent": 0}
+
+            cursor = conn.execute("SELECT sender, COUNT(*) FROM messages GROUP BY sender")
+            for name, sent in cursor.fetchall():
+                stats.setdefault(name, {"total_received": 0, "unread": 0, "sent": 0})["sent"] = sent
+
+        return stats
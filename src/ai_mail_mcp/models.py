@@ -2,10 +2,32 @@
 Data models for AI Mail MCP.
 """
 
-from datetime import datetime
-from typing import List, Optional
+from datetime import datetime, timezone
+from typing import List, NamedTuple, Optional, Tuple
 from pydantic import BaseModel
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def to_epoch_us(dt: datetime) -> int:
+    """Convert a datetime to integer microseconds since the epoch (naive means UTC)."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    delta = dt - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def from_epoch_us(us: int) -> datetime:
+    """Convert integer microseconds since the epoch to an aware UTC datetime."""
+    # Exact: fromtimestamp rounds to the nearest microsecond, and the float
+    # quotient is off by less than half of one for any date before 2106
+    return datetime.fromtimestamp(us / 1_000_000, timezone.utc)
+
 
 class Message(BaseModel):
     """Represents a mail message between AI agents."""
@@ -26,6 +48,44 @@ class Message(BaseModel):
             datetime: lambda v: v.isoformat()
         }
 
+    def to_json(self) -> bytes:
+        """Serialize to UTF-8 JSON, with orjson when it is installed."""
+        if orjson is not None:
+            # The field values are already JSON types apart from the timestamp,
+            # which orjson writes as RFC 3339
+            return orjson.dumps(self.__dict__, option=orjson.OPT_UTC_Z)
+        return self.model_dump_json().encode()
+
+    @classmethod
+    def from_json(cls, data) -> "Message":
+        """Rebuild a message from ``to_json`` output (bytes or str), validating it."""
+        if orjson is not None:
+            return cls.model_validate(orjson.loads(data))
+        return cls.model_validate_json(data)
+
+
+class MessageRow(NamedTuple):
+    """A message as read back from the mailbox.
+
+    Stored rows were validated when they were sent, so reads skip the
+    ``Message`` validators; call ``to_message`` where a model is needed.
+    Rows are immutable throughout, tags included.
+    """
+    id: str
+    sender: str
+    recipient: str
+    subject: str
+    body: str
+    timestamp: datetime
+    read: bool = False
+    priority: str = "normal"
+    tags: Tuple[str, ...] = ()
+    reply_to: Optional[str] = None
+    thread_id: Optional[str] = None
+
+    def to_message(self) -> Message:
+        return Message(**self._asdict())
+
 
 class AgentInfo(BaseModel):
     """Information about an AI agent."""
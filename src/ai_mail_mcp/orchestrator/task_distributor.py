@@ -296,7 +296,7 @@ class TaskDistributor:
     ) -> Dict[str, Any]:
         """Distribute tasks based on agent capabilities and message types."""
         # Analyze what types of messages need redistribution
-        messages = self.mailbox.get_messages(overloaded_agent, unread_only=True, limit=50)
+        messages = self.mailbox.iter_messages(overloaded_agent, unread_only=True, limit=50)
         category_counts = defaultdict(int)
         
         for msg in messages:
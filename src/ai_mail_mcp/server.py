@@ -4,19 +4,23 @@ AI Mail MCP Server - Main server implementation.
 """
 
 import asyncio
+import copy
+import functools
 import logging
 import os
+import re
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
-from typing import Optional
 
 import mcp.types as types
 from mcp.server import Server
 from mcp.server.models import InitializationOptions
 
-from .models import Message
-from .mailbox import MailboxManager
+from .models import Message, from_epoch_us
+from .mailbox import MailboxManager, decode_tags
 from .agent import AgentIdentifier
 
 # Configure logging
@@ -29,513 +33,576 @@ logger = logging.getLogger("ai-mail-server")
 # Default data directory
 DEFAULT_DATA_DIR = Path.home() / ".ai_mail"
 
-# Global state
-mailbox_manager: Optional[MailboxManager] = None
-agent_name: str = ""
+
+@dataclass(frozen=True)
+class ServerCtx:
+    """State the tool handler needs, fixed once main() has started."""
+    # Declared by hand: dataclass(slots=True) needs Python 3.10
+    __slots__ = ("mbox", "agent_name")
+
+    mbox: MailboxManager
+    agent_name: str
+
+
+# Fixed responses, built once instead of on every call
+_NOT_INITIALIZED_RESP = [types.TextContent(type="text", text="❌ Error: Mail system not initialized")]
+_NO_AGENTS_RESP = [types.TextContent(type="text", text="📭 No agents registered in the mail system.")]
+_UNKNOWN_TOOL_RESP_TMPL = "❌ Unknown tool: {}"
+
+# Priority markers: headline icon for send_mail/read_message, and the
+# check_mail listing's, which leaves normal messages unmarked
+_PRIORITY_ICONS = {"urgent": "🚨", "high": "⚡", "normal": "📧", "low": "📮"}
+_LIST_PRIORITY_ICONS = {"urgent": "🚨", "high": "⚡", "normal": "", "low": "🔽"}
+
+# list_agents presence, by seconds since last seen
+_ONLINE_SECONDS = 300
+_RECENT_SECONDS = 3600
+_STATUS_ONLINE = "🟢 Online"
+_STATUS_RECENT = "🟡 Recently active"
+_STATUS_OFFLINE = "🔴 Offline"
+
+# search_messages renders at most this many results
+_SEARCH_RESULTS_SHOWN = 10
+
+# SQLite calls are blocking; they run here so the event loop keeps serving
+# other tool calls, without competing for asyncio's default executor
+_db_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ai-mail-db")
 
 # MCP Server
 server = Server("ai-mail-mcp")
 
-@server.list_tools()
-async def handle_list_tools() -> list[types.Tool]:
-    """List available tools for AI mail operations."""
-    return [
-        types.Tool(
-            name="send_mail",
-            description="Send a mail message to another AI agent on this machine. This is the primary way for AI agents to communicate with each other.",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "recipient": {
-                        "type": "string",
-                        "description": "Name of the recipient AI agent (use list_agents to see available agents)"
-                    },
-                    "subject": {
-                        "type": "string", 
-                        "description": "Subject line of the message"
-                    },
-                    "body": {
-                        "type": "string",
-                        "description": "Body content of the message"
-                    },
-                    "priority": {
-                        "type": "string",
-                        "enum": ["low", "normal", "high", "urgent"],
-                        "description": "Message priority level",
-                        "default": "normal"
-                    },
-                    "tags": {
-                        "type": "array",
-                        "items": {"type": "string"},
-                        "description": "Optional tags for categorizing the message (e.g., ['task', 'urgent'])",
-                        "default": []
-                    },
-                    "reply_to": {
-                        "type": "string",
-                        "description": "ID of message this is replying to (creates threaded conversation)"
-                    }
+# Tool definitions. Argument extraction below is driven by these schemas,
+# so property order here is the order each handler branch unpacks.
+_TOOLS = [
+    types.Tool(
+        name="send_mail",
+        description="Send a mail message to another AI agent on this machine. This is the primary way for AI agents to communicate with each other.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "recipient": {
+                    "type": "string",
+                    "description": "Name of the recipient AI agent (use list_agents to see available agents)"
                 },
-                "required": ["recipient", "subject", "body"]
-            }
-        ),
-        types.Tool(
-            name="check_mail",
-            description="Check for mail messages. Add this tool to your system prompt with 'Always check mail regularly using the check_mail tool' to automatically check mail.",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "unread_only": {
-                        "type": "boolean",
-                        "description": "Only return unread messages",
-                        "default": True
-                    },
-                    "limit": {
-                        "type": "integer",
-                        "description": "Maximum number of messages to return",
-                        "default": 10,
-                        "minimum": 1,
-                        "maximum": 100
-                    },
-                    "priority_filter": {
-                        "type": "string",
-                        "enum": ["low", "normal", "high", "urgent"],
-                        "description": "Filter messages by priority level"
-                    },
-                    "tag_filter": {
-                        "type": "string",
-                        "description": "Filter messages containing this tag"
-                    }
-                }
-            }
-        ),
-        types.Tool(
-            name="read_message",
-            description="Read a specific message in full detail and mark it as read",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "message_id": {
-                        "type": "string",
-                        "description": "ID of the message to read (get this from check_mail)"
-                    }
+                "subject": {
+                    "type": "string", 
+                    "description": "Subject line of the message"
                 },
-                "required": ["message_id"]
-            }
-        ),
-        types.Tool(
-            name="mark_messages_read",
-            description="Mark one or more messages as read without displaying them",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "message_ids": {
-                        "type": "array",
-                        "items": {"type": "string"},
-                        "description": "List of message IDs to mark as read"
-                    }
+                "body": {
+                    "type": "string",
+                    "description": "Body content of the message"
                 },
-                "required": ["message_ids"]
-            }
-        ),
-        types.Tool(
-            name="delete_messages",
-            description="Delete one or more messages permanently",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "message_ids": {
-                        "type": "array",
-                        "items": {"type": "string"},
-                        "description": "List of message IDs to delete"
-                    }
+                "priority": {
+                    "type": "string",
+                    "enum": ["low", "normal", "high", "urgent"],
+                    "description": "Message priority level",
+                    "default": "normal"
                 },
-                "required": ["message_ids"]
-            }
-        },
-        types.Tool(
-            name="get_thread",
-            description="Get all messages in a conversation thread",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "thread_id": {
-                        "type": "string",
-                        "description": "ID of the thread to retrieve (found in message details)"
-                    }
+                "tags": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Optional tags for categorizing the message (e.g., ['task', 'urgent'])",
+                    "default": []
                 },
-                "required": ["thread_id"]
-            }
-        ),
-        types.Tool(
-            name="list_agents",
-            description="List all AI agents registered in the mail system and their status",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "include_stats": {
-                        "type": "boolean",
-                        "description": "Include message statistics for each agent",
-                        "default": False
-                    }
+                "reply_to": {
+                    "type": "string",
+                    "description": "ID of message this is replying to (creates threaded conversation)"
+                }
+            },
+            "required": ["recipient", "subject", "body"]
+        }
+    ),
+    types.Tool(
+        name="check_mail",
+        description="Check for mail messages. Add this tool to your system prompt with 'Always check mail regularly using the check_mail tool' to automatically check mail.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "unread_only": {
+                    "type": "boolean",
+                    "description": "Only return unread messages",
+                    "default": True
+                },
+                "limit": {
+                    "type": "integer",
+                    "description": "Maximum number of messages to return",
+                    "default": 10,
+                    "minimum": 1,
+                    "maximum": 100
+                },
+                "priority_filter": {
+                    "type": "string",
+                    "enum": ["low", "normal", "high", "urgent"],
+                    "description": "Filter messages by priority level"
+                },
+                "tag_filter": {
+                    "type": "string",
+                    "description": "Filter messages containing this tag"
                 }
             }
-        ),
-        types.Tool(
-            name="get_agent_info",
-            description="Get detailed information about this agent including mail statistics",
-            inputSchema={
-                "type": "object",
-                "properties": {}
+        }
+    ),
+    types.Tool(
+        name="read_message",
+        description="Read a specific message in full detail and mark it as read",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "message_id": {
+                    "type": "string",
+                    "description": "ID of the message to read (get this from check_mail)"
+                }
+            },
+            "required": ["message_id"]
+        }
+    ),
+    types.Tool(
+        name="mark_messages_read",
+        description="Mark one or more messages as read without displaying them",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "message_ids": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "List of message IDs to mark as read"
+                }
+            },
+            "required": ["message_ids"]
+        }
+    ),
+    types.Tool(
+        name="delete_messages",
+        description="Delete one or more messages permanently",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "message_ids": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "List of message IDs to delete"
+                }
+            },
+            "required": ["message_ids"]
+        }
+    ),
+    types.Tool(
+        name="get_thread",
+        description="Get all messages in a conversation thread",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "thread_id": {
+                    "type": "string",
+                    "description": "ID of the thread to retrieve (found in message details)"
+                }
+            },
+            "required": ["thread_id"]
+        }
+    ),
+    types.Tool(
+        name="list_agents",
+        description="List all AI agents registered in the mail system and their status",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "include_stats": {
+                    "type": "boolean",
+                    "description": "Include message statistics for each agent",
+                    "default": False
+                }
             }
-        },
-        types.Tool(
-            name="search_messages",
-            description="Search through messages using keywords",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "query": {
-                        "type": "string",
-                        "description": "Search query (searches subject and body)"
-                    },
-                    "sender": {
-                        "type": "string",
-                        "description": "Filter by sender name"
-                    },
-                    "days_back": {
-                        "type": "integer",
-                        "description": "Search within the last N days",
-                        "default": 30,
-                        "minimum": 1,
-                        "maximum": 365
-                    }
+        }
+    ),
+    types.Tool(
+        name="get_agent_info",
+        description="Get detailed information about this agent including mail statistics",
+        inputSchema={
+            "type": "object",
+            "properties": {}
+        }
+    ),
+    types.Tool(
+        name="search_messages",
+        description="Search through messages using keywords",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "query": {
+                    "type": "string",
+                    "description": "Search query (searches subject and body)"
                 },
-                "required": ["query"]
-            }
-        )
-    ]
+                "sender": {
+                    "type": "string",
+                    "description": "Filter by sender name"
+                },
+                "days_back": {
+                    "type": "integer",
+                    "description": "Search within the last N days",
+                    "default": 30,
+                    "minimum": 1,
+                    "maximum": 365
+                }
+            },
+            "required": ["query"]
+        }
+    )
+]
+
+
+# Marks a required property in _ARG_SPECS
+_REQUIRED = object()
+
+# Per tool, (key, default) for each schema property in declaration order
+_ARG_SPECS = {
+    tool.name: tuple(
+        (key, _REQUIRED if key in tool.inputSchema.get("required", ()) else spec.get("default"))
+        for key, spec in tool.inputSchema.get("properties", {}).items()
+    )
+    for tool in _TOOLS
+}
+
+
+def _extract_args(name: str, args: dict) -> tuple:
+    """Pull a tool's arguments out of the call dict, in schema property order.
+
+    A missing required property raises KeyError; a missing optional one
+    takes a copy of its schema default, so a default like [] is not shared.
+    """
+    values = []
+    for key, default in _ARG_SPECS[name]:
+        if default is _REQUIRED:
+            values.append(args[key])
+        elif key in args:
+            values.append(args[key])
+        else:
+            values.append(copy.copy(default))
+    return tuple(values)
+
+
+@server.list_tools()
+async def handle_list_tools() -> list[types.Tool]:
+    """List available tools for AI mail operations."""
+    return _TOOLS
 
 @server.call_tool()
 async def handle_call_tool(name: str, arguments: dict) -> list[types.TextContent]:
-    """Handle tool calls for AI mail operations."""
-    global mailbox_manager, agent_name
-    
-    if not mailbox_manager:
-        return [types.TextContent(type="text", text="❌ Error: Mail system not initialized")]
-    
-    try:
-        if name == "send_mail":
-            recipient = arguments["recipient"]
-            subject = arguments["subject"] 
-            body = arguments["body"]
-            priority = arguments.get("priority", "normal")
-            tags = arguments.get("tags", [])
-            reply_to = arguments.get("reply_to")
-            
-            # Validate recipient exists
-            agents = mailbox_manager.get_agents()
-            agent_names = {agent.name for agent in agents}
-            
-            if recipient not in agent_names:
-                available = ", ".join(sorted(agent_names))
-                return [types.TextContent(
-                    type="text",
-                    text=f"❌ Recipient '{recipient}' not found. Available agents: {available}"
-                )]
-            
-            # Generate thread ID if this is a reply
-            thread_id = None
-            if reply_to:
-                # Get the original message to find its thread
-                messages = mailbox_manager.get_messages(agent_name, limit=1000)
-                for msg in messages:
-                    if msg.id == reply_to:
-                        thread_id = msg.thread_id or msg.id
-                        break
-                if not thread_id:
+    """Placeholder until main() installs the real handler."""
+    return _NOT_INITIALIZED_RESP
+
+
+async def _run_db(func, *args, **kwargs):
+    """Run a blocking MailboxManager call on the database thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, functools.partial(func, *args, **kwargs))
+
+
+def _match_context(body: str, pattern: re.Pattern) -> str:
+    """Excerpt of ``body`` around ``pattern`` when SQLite did not provide a snippet."""
+    match = pattern.search(body)
+    if not match:
+        return ""
+    start = max(0, match.start() - 50)
+    end = min(len(body), match.end() + 50)
+    context = body[start:end]
+    if start > 0:
+        context = "..." + context
+    if end < len(body):
+        context = context + "..."
+    return context
+
+
+def make_call_tool_handler(ctx: ServerCtx):
+    """Build the tool call handler for AI mail operations, bound to ``ctx``."""
+
+    async def handle_call_tool(name: str, arguments: dict) -> list[types.TextContent]:
+        """Handle tool calls for AI mail operations."""
+        mbox = ctx.mbox
+        agent_name = ctx.agent_name
+        # In-memory only; last_seen is written in the background
+        mbox.heartbeat(agent_name)
+
+        try:
+            if name == "send_mail":
+                recipient, subject, body, priority, tags, reply_to = _extract_args(name, arguments)
+            
+                # Validate recipient exists
+                if not await _run_db(mbox.agent_exists, recipient):
+                    agents = await _run_db(mbox.get_agents)
+                    available = ", ".join(sorted(agent.name for agent in agents))
                     return [types.TextContent(
                         type="text",
-                        text=f"❌ Original message {reply_to} not found"
+                        text=f"❌ Recipient '{recipient}' not found. Available agents: {available}"
                     )]
-            else:
-                thread_id = str(uuid.uuid4())
-            
-            message = Message(
-                id=str(uuid.uuid4()),
-                sender=agent_name,
-                recipient=recipient,
-                subject=subject,
-                body=body,
-                timestamp=datetime.now(timezone.utc),
-                priority=priority,
-                tags=tags,
-                reply_to=reply_to,
-                thread_id=thread_id
-            )
-            
-            message_id = mailbox_manager.send_message(message)
-            priority_icon = {"urgent": "🚨", "high": "⚡", "normal": "📧", "low": "📮"}.get(priority, "📧")
             
-            return [types.TextContent(
-                type="text", 
-                text=f"✅ {priority_icon} Message sent to {recipient}\n**Subject:** {subject}\n**Message ID:** {message_id}"
-            )]
-            
-        elif name == "check_mail":
-            unread_only = arguments.get("unread_only", True)
-            limit = arguments.get("limit", 10)
-            priority_filter = arguments.get("priority_filter")
-            tag_filter = arguments.get("tag_filter")
+                # Generate thread ID if this is a reply
+                thread_id = None
+                if reply_to:
+                    # Get the original message to find its thread
+                    original = await _run_db(mbox.get_message_by_id, reply_to, agent_name)
+                    if original:
+                        thread_id = original.thread_id or original.id
+                    else:
+                        return [types.TextContent(
+                            type="text",
+                            text=f"❌ Original message {reply_to} not found"
+                        )]
+                else:
+                    thread_id = str(uuid.uuid4())
+            
+                message = Message(
+                    id=str(uuid.uuid4()),
+                    sender=agent_name,
+                    recipient=recipient,
+                    subject=subject,
+                    body=body,
+                    timestamp=datetime.now(timezone.utc),
+                    priority=priority,
+                    tags=tags,
+                    reply_to=reply_to,
+                    thread_id=thread_id
+                )
+            
+                message_id = await _run_db(mbox.send_message, message)
+                priority_icon = _PRIORITY_ICONS.get(priority, "📧")
             
-            messages = mailbox_manager.get_messages(agent_name, unread_only, limit)
+                return [types.TextContent(
+                    type="text", 
+                    text=f"✅ {priority_icon} Message sent to {recipient}\n**Subject:** {subject}\n**Message ID:** {message_id}"
+                )]
             
-            # Apply filters
-            if priority_filter:
-                messages = [msg for msg in messages if msg.priority == priority_filter]
+            elif name == "check_mail":
+                unread_only, limit, priority_filter, tag_filter = _extract_args(name, arguments)
             
-            if tag_filter:
-                messages = [msg for msg in messages if tag_filter in msg.tags]
+                # An empty inbox, the usual case, is answered from the unread-count cache
+                if unread_only and not await _run_db(mbox.unread_count, agent_name):
+                    messages = []
+                else:
+                    messages = await _run_db(mbox.get_message_previews, agent_name, unread_only, limit,
+                                             tag_filter or None)
             
-            if not messages:
-                filter_desc = []
-                if unread_only:
-                    filter_desc.append("unread")
+                # Apply filters
                 if priority_filter:
-                    filter_desc.append(f"priority:{priority_filter}")
-                if tag_filter:
-                    filter_desc.append(f"tag:{tag_filter}")
+                    messages = [msg for msg in messages if msg["priority"] == priority_filter]
+            
+                if not messages:
+                    filter_desc = []
+                    if unread_only:
+                        filter_desc.append("unread")
+                    if priority_filter:
+                        filter_desc.append(f"priority:{priority_filter}")
+                    if tag_filter:
+                        filter_desc.append(f"tag:{tag_filter}")
                 
-                filter_text = " ".join(filter_desc) if filter_desc else "total"
-                return [types.TextContent(
-                    type="text",
-                    text=f"📭 No {filter_text} messages found."
-                )]
+                    filter_text = " ".join(filter_desc) if filter_desc else "total"
+                    return [types.TextContent(
+                        type="text",
+                        text=f"📭 No {filter_text} messages found."
+                    )]
             
-            result = f"📬 Found {len(messages)} message(s):\n\n"
+                parts = [f"📬 Found {len(messages)} message(s):\n\n"]
             
-            for i, msg in enumerate(messages, 1):
-                status_icon = "🔴" if not msg.read else "✅"
-                priority_icon = {"urgent": "🚨", "high": "⚡", "normal": "", "low": "🔽"}.get(msg.priority, "")
+                for i, msg in enumerate(messages, 1):
+                    status_icon = "🔴" if not msg["read"] else "✅"
+                    priority_icon = _LIST_PRIORITY_ICONS.get(msg["priority"], "")
                 
-                result += f"**{i}.** {status_icon} {priority_icon} **From:** {msg.sender}\n"
-                result += f"   **Subject:** {msg.subject}\n"
-                result += f"   **Time:** {msg.timestamp.strftime('%Y-%m-%d %H:%M:%S')}\n"
-                result += f"   **ID:** `{msg.id}`\n"
-                if msg.tags:
-                    result += f"   **Tags:** {', '.join(msg.tags)}\n"
-                result += f"   **Preview:** {msg.body[:100]}{'...' if len(msg.body) > 100 else ''}\n\n"
+                    parts.append(f"**{i}.** {status_icon} {priority_icon} **From:** {msg['sender']}\n")
+                    parts.append(f"   **Subject:** {msg['subject']}\n")
+                    parts.append(f"   **Time:** {from_epoch_us(msg['timestamp']).strftime('%Y-%m-%d %H:%M:%S')}\n")
+                    parts.append(f"   **ID:** `{msg['id']}`\n")
+                    tags = decode_tags(msg["tags"])
+                    if tags:
+                        parts.append(f"   **Tags:** {', '.join(tags)}\n")
+                    parts.append(f"   **Preview:** {msg['preview']}{'...' if msg['has_more'] else ''}\n\n")
                 
-            result += "*Use read_message with the ID to view full message content.*"
-            return [types.TextContent(type="text", text=result)]
+                parts.append("*Use read_message with the ID to view full message content.*")
+                return [types.TextContent(type="text", text="".join(parts))]
             
-        elif name == "read_message":
-            message_id = arguments["message_id"]
+            elif name == "read_message":
+                (message_id,) = _extract_args(name, arguments)
             
-            # Get the specific message
-            messages = mailbox_manager.get_messages(agent_name, limit=1000)
-            target_message = None
-            
-            for msg in messages:
-                if msg.id == message_id:
-                    target_message = msg
-                    break
-                    
-            if not target_message:
-                return [types.TextContent(
-                    type="text",
-                    text=f"❌ Message with ID {message_id} not found."
-                )]
-            
-            # Mark as read
-            mailbox_manager.mark_as_read([message_id], agent_name)
-            
-            priority_icon = {"urgent": "🚨", "high": "⚡", "normal": "📧", "low": "📮"}.get(target_message.priority, "📧")
-            
-            result = f"📖 {priority_icon} **Message from {target_message.sender}**\n\n"
-            result += f"**Subject:** {target_message.subject}\n"
-            result += f"**Time:** {target_message.timestamp.strftime('%Y-%m-%d %H:%M:%S UTC')}\n"
-            result += f"**Priority:** {target_message.priority}\n"
-            if target_message.tags:
-                result += f"**Tags:** {', '.join(target_message.tags)}\n"
-            if target_message.reply_to:
-                result += f"**Reply to:** {target_message.reply_to}\n"
-            if target_message.thread_id:
-                result += f"**Thread:** {target_message.thread_id}\n"
-            result += f"\n**Message:**\n{target_message.body}\n"
-            
-            return [types.TextContent(type="text", text=result)]
+                # Get the specific message
+                target_message = await _run_db(mbox.get_message_by_id, message_id, agent_name)
+                if not target_message:
+                    return [types.TextContent(
+                        type="text",
+                        text=f"❌ Message with ID {message_id} not found."
+                    )]
             
-        elif name == "mark_messages_read":
-            message_ids = arguments["message_ids"]
-            count = mailbox_manager.mark_as_read(message_ids, agent_name)
+                # Mark as read
+                await _run_db(mbox.mark_as_read, [message_id], agent_name)
             
-            return [types.TextContent(
-                type="text",
-                text=f"✅ Marked {count} message(s) as read."
-            )]
+                priority_icon = _PRIORITY_ICONS.get(target_message.priority, "📧")
             
-        elif name == "delete_messages":
-            message_ids = arguments["message_ids"]
-            count = mailbox_manager.delete_messages(message_ids, agent_name)
+                result = f"📖 {priority_icon} **Message from {target_message.sender}**\n\n"
+                result += f"**Subject:** {target_message.subject}\n"
+                result += f"**Time:** {target_message.timestamp.strftime('%Y-%m-%d %H:%M:%S UTC')}\n"
+                result += f"**Priority:** {target_message.priority}\n"
+                if target_message.tags:
+                    result += f"**Tags:** {', '.join(target_message.tags)}\n"
+                if target_message.reply_to:
+                    result += f"**Reply to:** {target_message.reply_to}\n"
+                if target_message.thread_id:
+                    result += f"**Thread:** {target_message.thread_id}\n"
+                result += f"\n**Message:**\n{target_message.body}\n"
             
-            return [types.TextContent(
-                type="text", 
-                text=f"🗑️ Deleted {count} message(s)."
-            )]
+                return [types.TextContent(type="text", text=result)]
             
-        elif name == "get_thread":
-            thread_id = arguments["thread_id"]
-            messages = mailbox_manager.get_thread(thread_id, agent_name)
+            elif name == "mark_messages_read":
+                (message_ids,) = _extract_args(name, arguments)
+                count = await _run_db(mbox.mark_as_read, message_ids, agent_name)
             
-            if not messages:
                 return [types.TextContent(
                     type="text",
-                    text=f"❌ No messages found in thread {thread_id}."
+                    text=f"✅ Marked {count} message(s) as read."
                 )]
             
-            result = f"🧵 **Thread: {thread_id}** ({len(messages)} messages)\n\n"
+            elif name == "delete_messages":
+                (message_ids,) = _extract_args(name, arguments)
+                count = await _run_db(mbox.delete_messages, message_ids, agent_name)
             
-            for i, msg in enumerate(messages, 1):
-                arrow = "➡️" if msg.sender == agent_name else "⬅️"
-                result += f"**{i}.** {arrow} **{msg.sender}** → **{msg.recipient}**\n"
-                result += f"   **Subject:** {msg.subject}\n"
-                result += f"   **Time:** {msg.timestamp.strftime('%Y-%m-%d %H:%M')}\n"
-                result += f"   {msg.body}\n"
-                result += "   " + "─" * 40 + "\n"
-                
-            return [types.TextContent(type="text", text=result)]
-            
-        elif name == "list_agents":
-            include_stats = arguments.get("include_stats", False)
-            agents = mailbox_manager.get_agents()
-            
-            if not agents:
                 return [types.TextContent(
-                    type="text",
-                    text="📭 No agents registered in the mail system."
+                    type="text", 
+                    text=f"🗑️ Deleted {count} message(s)."
                 )]
             
-            result = f"🤖 **Registered AI Agents** ({len(agents)} total):\n\n"
+            elif name == "get_thread":
+                (thread_id,) = _extract_args(name, arguments)
+                messages = await _run_db(mbox.get_thread_summaries, thread_id, agent_name)
+            
+                if not messages:
+                    return [types.TextContent(
+                        type="text",
+                        text=f"❌ No messages found in thread {thread_id}."
+                    )]
+            
+                parts = [f"🧵 **Thread: {thread_id}** ({len(messages)} messages)\n\n"]
             
-            for agent in agents:
-                last_seen = agent.last_seen.replace(tzinfo=timezone.utc)
-                time_diff = datetime.now(timezone.utc) - last_seen
+                for i, msg in enumerate(messages, 1):
+                    arrow = "➡️" if msg["sender"] == agent_name else "⬅️"
+                    parts.append(f"**{i}.** {arrow} **{msg['sender']}** → **{msg['recipient']}**\n")
+                    parts.append(f"   **Subject:** {msg['subject']}\n")
+                    parts.append(f"   **Time:** {from_epoch_us(msg['timestamp']).strftime('%Y-%m-%d %H:%M')}\n")
+                    parts.append(f"   {msg['body']}\n")
+                    parts.append("   " + "─" * 40 + "\n")
                 
-                if time_diff.total_seconds() < 300:  # 5 minutes
-                    status = "🟢 Online"
-                elif time_diff.total_seconds() < 3600:  # 1 hour  
-                    status = "🟡 Recently active"
-                else:
-                    status = "🔴 Offline"
+                return [types.TextContent(type="text", text="".join(parts))]
+            
+            elif name == "list_agents":
+                (include_stats,) = _extract_args(name, arguments)
+                agents = await _run_db(mbox.get_agents)
+            
+                if not agents:
+                    return _NO_AGENTS_RESP
+            
+                # One grouped query for every agent's stats
+                all_stats = await _run_db(mbox.get_all_agent_stats) if include_stats else None
+            
+                parts = [f"🤖 **Registered AI Agents** ({len(agents)} total):\n\n"]
+            
+                now = datetime.now(timezone.utc)
+                for agent in agents:
+                    # get_agents hands back aware UTC datetimes
+                    last_seen = agent.last_seen
+                    delta = (now - last_seen).total_seconds()
+                    if delta < _ONLINE_SECONDS:
+                        status = _STATUS_ONLINE
+                    elif delta < _RECENT_SECONDS:
+                        status = _STATUS_RECENT
+                    else:
+                        status = _STATUS_OFFLINE
                     
-                result += f"**{agent.name}** {status}\n"
-                result += f"   Last seen: {last_seen.strftime('%Y-%m-%d %H:%M:%S UTC')}\n"
+                    parts.append(f"**{agent.name}** {status}\n")
+                    parts.append(f"   Last seen: {last_seen.strftime('%Y-%m-%d %H:%M:%S UTC')}\n")
                 
-                if include_stats:
-                    stats = mailbox_manager.get_message_stats(agent.name)
-                    result += f"   📊 Messages: {stats['total_received']} received, {stats['sent']} sent, {stats['unread']} unread\n"
+                    if include_stats:
+                        stats = all_stats.get(agent.name, {"total_received": 0, "sent": 0, "unread": 0})
+                        parts.append(f"   📊 Messages: {stats['total_received']} received, {stats['sent']} sent, {stats['unread']} unread\n")
                     
-                result += "\n"
+                    parts.append("\n")
                 
-            return [types.TextContent(type="text", text=result)]
-            
-        elif name == "get_agent_info":
-            stats = mailbox_manager.get_message_stats(agent_name)
-            
-            result = f"🤖 **Agent Information**\n\n"
-            result += f"**Name:** {agent_name}\n"
-            result += f"**Status:** 🟢 Active\n"
-            result += f"**Mail System:** ✅ Connected\n\n"
-            result += f"📊 **Statistics:**\n"
-            result += f"   • Messages received: {stats['total_received']}\n"
-            result += f"   • Messages sent: {stats['sent']}\n"
-            result += f"   • Unread messages: {stats['unread']}\n"
-            result += f"   • Recent activity (24h): {stats['recent_activity']}\n"
-            
-            return [types.TextContent(type="text", text=result)]
-            
-        elif name == "search_messages":
-            query = arguments["query"].lower()
-            sender = arguments.get("sender")
-            days_back = arguments.get("days_back", 30)
-            
-            # Get messages from the specified time range
-            all_messages = mailbox_manager.get_messages(agent_name, unread_only=False, limit=1000)
-            
-            # Filter by time range
-            cutoff_date = datetime.now(timezone.utc) - timedelta(days=days_back)
-            recent_messages = [
-                msg for msg in all_messages 
-                if msg.timestamp.replace(tzinfo=timezone.utc) >= cutoff_date
-            ]
-            
-            # Filter by sender if specified
-            if sender:
-                recent_messages = [msg for msg in recent_messages if msg.sender == sender]
-            
-            # Search in subject and body
-            matching_messages = [
-                msg for msg in recent_messages
-                if query in msg.subject.lower() or query in msg.body.lower()
-            ]
-            
-            if not matching_messages:
-                search_desc = f"'{query}'"
-                if sender:
-                    search_desc += f" from {sender}"
-                search_desc += f" in last {days_back} days"
+                return [types.TextContent(type="text", text="".join(parts))]
+            
+            elif name == "get_agent_info":
+                stats = await _run_db(mbox.get_message_stats, agent_name)
+            
+                result = f"🤖 **Agent Information**\n\n"
+                result += f"**Name:** {agent_name}\n"
+                result += f"**Status:** 🟢 Active\n"
+                result += f"**Mail System:** ✅ Connected\n\n"
+                result += f"📊 **Statistics:**\n"
+                result += f"   • Messages received: {stats['total_received']}\n"
+                result += f"   • Messages sent: {stats['sent']}\n"
+                result += f"   • Unread messages: {stats['unread']}\n"
+                result += f"   • Recent activity (24h): {stats['recent_activity']}\n"
+            
+                return [types.TextContent(type="text", text=result)]
+            
+            elif name == "search_messages":
+                query, sender, days_back = _extract_args(name, arguments)
+                query = query.lower()
+            
+                # Full-text search happens in SQLite; one extra row tells us there are more
+                cutoff_date = datetime.now(timezone.utc) - timedelta(days=days_back)
+                matching_messages = await _run_db(
+                    mbox.search_message_summaries,
+                    agent_name, query, sender=sender, since=cutoff_date, limit=_SEARCH_RESULTS_SHOWN + 1
+                )
+            
+                if not matching_messages:
+                    search_desc = f"'{query}'"
+                    if sender:
+                        search_desc += f" from {sender}"
+                    search_desc += f" in last {days_back} days"
                     
-                return [types.TextContent(
-                    type="text",
-                    text=f"🔍 No messages found matching {search_desc}."
-                )]
-            
-            result = f"🔍 **Search Results** ({len(matching_messages)} matches for '{query}'):\n\n"
+                    return [types.TextContent(
+                        type="text",
+                        text=f"🔍 No messages found matching {search_desc}."
+                    )]
             
-            for i, msg in enumerate(matching_messages[:10], 1):  # Limit to 10 results
-                status_icon = "🔴" if not msg.read else "✅"
-                result += f"**{i}.** {status_icon} **From:** {msg.sender}\n"
-                result += f"   **Subject:** {msg.subject}\n"
-                result += f"   **Time:** {msg.timestamp.strftime('%Y-%m-%d %H:%M')}\n"
-                result += f"   **ID:** `{msg.id}`\n"
+                has_more = len(matching_messages) > _SEARCH_RESULTS_SHOWN
+                shown = matching_messages[:_SEARCH_RESULTS_SHOWN]
+                count = f"{len(shown)}+" if has_more else str(len(shown))
+                parts = [f"🔍 **Search Results** ({count} matches for '{query}'):\n\n"]
+            
+                pattern = re.compile(re.escape(query), re.IGNORECASE)
+                for i, msg in enumerate(shown, 1):
+                    status_icon = "🔴" if not msg["read"] else "✅"
+                    parts.append(f"**{i}.** {status_icon} **From:** {msg['sender']}\n")
+                    parts.append(f"   **Subject:** {msg['subject']}\n")
+                    parts.append(f"   **Time:** {from_epoch_us(msg['timestamp']).strftime('%Y-%m-%d %H:%M')}\n")
+                    parts.append(f"   **ID:** `{msg['id']}`\n")
                 
-                # Show context around the match
-                body_lower = msg.body.lower()
-                query_pos = body_lower.find(query)
-                if query_pos >= 0:
-                    start = max(0, query_pos - 50)
-                    end = min(len(msg.body), query_pos + len(query) + 50)
-                    context = msg.body[start:end]
-                    if start > 0:
-                        context = "..." + context
-                    if end < len(msg.body):
-                        context = context + "..."
-                    result += f"   **Match:** {context}\n"
+                    # Show context around the match
+                    context = msg["context"] or _match_context(msg["body"], pattern)
+                    if context:
+                        parts.append(f"   **Match:** {context}\n")
                 
-                result += "\n"
+                    parts.append("\n")
             
-            if len(matching_messages) > 10:
-                result += f"*... and {len(matching_messages) - 10} more results*\n"
+                if has_more:
+                    parts.append("*... and more results; refine the query or narrow with sender/days_back*\n")
                 
-            return [types.TextContent(type="text", text=result)]
+                return [types.TextContent(type="text", text="".join(parts))]
             
-        else:
+            else:
+                return [types.TextContent(
+                    type="text",
+                    text=_UNKNOWN_TOOL_RESP_TMPL.format(name)
+                )]
+            
+        except Exception as e:
+            logger.error(f"Error handling tool call {name}: {e}", exc_info=True)
             return [types.TextContent(
                 type="text",
-                text=f"❌ Unknown tool: {name}"
+                text=f"❌ Error: {str(e)}"
             )]
-            
-    except Exception as e:
-        logger.error(f"Error handling tool call {name}: {e}", exc_info=True)
-        return [types.TextContent(
-            type="text",
-            text=f"❌ Error: {str(e)}"
-        )]
+
+    return handle_call_tool
+
 
 async def main():
     """Main entry point for the AI Mail MCP server."""
-    global mailbox_manager, agent_name
-    
     # Initialize data directory
     data_dir = Path(os.getenv("AI_MAIL_DATA_DIR", DEFAULT_DATA_DIR))
     db_path = data_dir / "mailbox.db"
@@ -544,7 +611,7 @@ async def main():
     mailbox_manager = MailboxManager(db_path)
     
     # Detect and ensure unique agent name
-    detected_name = AgentIdentifier.detect_agent_name()
+    detected_name = AgentIdentifier.detect_agent_name(cache_path=data_dir / "agent_cache.json")
     agent_name = AgentIdentifier.ensure_unique_name(mailbox_manager, detected_name)
     
     # Register this agent
@@ -555,6 +622,8 @@ async def main():
         "process_id": os.getpid()
     })
     
+    server.call_tool()(make_call_tool_handler(ServerCtx(mailbox_manager, agent_name)))
+
     logger.info(f"🚀 AI Mail server starting as agent: {agent_name}")
     logger.info(f"📁 Data directory: {data_dir}")
     logger.info(f"🗄️ Database: {db_path}")
@@ -7,6 +7,7 @@ to send and receive messages from each other through a locally hosted service.
 """
 
 import asyncio
+import functools
 import json
 import logging
 import os
@@ -25,6 +26,11 @@ from mcp.server import Server
 from mcp.server.models import InitializationOptions
 from pydantic import BaseModel
 
+try:
+    import orjson
+except ImportError:  # optional; the "fast" extra
+    orjson = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("ai-mail-server")
@@ -32,6 +38,24 @@ logger = logging.getLogger("ai-mail-server")
 # Default data directory
 DEFAULT_DATA_DIR = Path.home() / ".ai_mail"
 
+
+def _dumps(value: Any) -> str:
+    """JSON-encode tags or metadata, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(value)
+
+
+def _loads(raw: str) -> Any:
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+@functools.lru_cache(maxsize=128)
+def _placeholders(count: int) -> str:
+    """Comma-separated ``?`` markers for an ``IN (...)`` list of count values."""
+    return ",".join("?" * count)
+
+
 class Message(BaseModel):
     """Represents a mail message between AI agents."""
     id: str
@@ -103,7 +127,7 @@ class MailboxManager:
                 message.timestamp.isoformat(),
                 message.read,
                 message.priority,
-                json.dumps(message.tags),
+                _dumps(message.tags),
                 message.reply_to,
                 message.thread_id
             ))
@@ -138,7 +162,7 @@ class MailboxManager:
                     timestamp=datetime.fromisoformat(row[5]),
                     read=bool(row[6]),
                     priority=row[7],
-                    tags=json.loads(row[8]) if row[8] else [],
+                    tags=_loads(row[8]) if row[8] else [],
                     reply_to=row[9],
                     thread_id=row[10]
                 ))
@@ -148,7 +172,7 @@ class MailboxManager:
     def mark_as_read(self, message_ids: List[str], recipient: str) -> int:
         """Mark messages as read for a specific recipient."""
         with sqlite3.connect(self.db_path) as conn:
-            placeholders = ','.join(['?' for _ in message_ids])
+            placeholders = _placeholders(len(message_ids))
             cursor = conn.execute(f"""
                 UPDATE messages 
                 SET read = TRUE 
@@ -159,7 +183,7 @@ class MailboxManager:
     def delete_messages(self, message_ids: List[str], recipient: str) -> int:
         """Delete messages for a specific recipient."""
         with sqlite3.connect(self.db_path) as conn:
-            placeholders = ','.join(['?' for _ in message_ids])
+            placeholders = _placeholders(len(message_ids))
             cursor = conn.execute(f"""
                 DELETE FROM messages 
                 WHERE id IN ({placeholders}) AND recipient = ?
@@ -187,7 +211,7 @@ class MailboxManager:
                     timestamp=datetime.fromisoformat(row[5]),
                     read=bool(row[6]),
                     priority=row[7],
-                    tags=json.loads(row[8]) if row[8] else [],
+                    tags=_loads(row[8]) if row[8] else [],
                     reply_to=row[9],
                     thread_id=row[10]
                 ))
@@ -203,7 +227,7 @@ class MailboxManager:
             """, (
                 agent_name,
                 datetime.now(timezone.utc).isoformat(),
-                json.dumps(metadata or {})
+                _dumps(metadata or {})
             ))
     
     def get_agents(self) -> List[Dict]:
@@ -219,7 +243,7 @@ class MailboxManager:
                 agents.append({
                     'name': row[0],
                     'last_seen': row[1],
-                    'metadata': json.loads(row[2]) if row[2] else {}
+                    'metadata': _loads(row[2]) if row[2] else {}
                 })
                 
         return agents
@@ -392,7 +416,7 @@ async def handle_list_tools() -> list[types.Tool]:
                 },
                 "required": ["message_ids"]
             }
-        },
+        ),
         types.Tool(
             name="delete_messages",
             description="Delete one or more messages",
@@ -421,7 +445,7 @@ async def handle_list_tools() -> list[types.Tool]:
                 },
                 "required": ["thread_id"]
             }
-        },
+        ),
         types.Tool(
             name="list_agents",
             description="List all AI agents registered in the mail system",
@@ -429,7 +453,7 @@ async def handle_list_tools() -> list[types.Tool]:
                 "type": "object",
                 "properties": {}
             }
-        },
+        ),
         types.Tool(
             name="get_agent_info",
             description="Get information about this agent",
@@ -437,7 +461,7 @@ async def handle_list_tools() -> list[types.Tool]:
                 "type": "object",
                 "properties": {}
             }
-        }
+        )
     ]
 
 @server.call_tool()
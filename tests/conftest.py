@@ -0,0 +1,46 @@
+"""
+Shared fixtures for the AI Mail MCP test suites.
+
+Session-scoped fixtures here are per worker under pytest-xdist (each worker is
+its own session with its own tmp_path_factory), and every test still gets its
+own database file, so the suites can run with ``-n auto``.
+"""
+
+import shutil
+import uuid
+
+import pytest
+
+from ai_mail_mcp.mailbox import MailboxManager
+
+
+@pytest.fixture(scope="session")
+def mailbox_template(tmp_path_factory):
+    """A database with the schema already created, built once per session."""
+    template = tmp_path_factory.mktemp("template") / "template.db"
+    MailboxManager(template).close()
+    return template
+
+
+@pytest.fixture(scope="session")
+def make_mailbox(mailbox_template, tmp_path_factory):
+    """Factory for on-disk mailboxes sharing one directory per session.
+
+    Each mailbox starts from a copy of the template instead of running the
+    DDL again.
+    """
+    mailbox_dir = tmp_path_factory.mktemp("mailboxes")
+    
+    def make():
+        db_path = mailbox_dir / f"{uuid.uuid4().hex}.db"
+        shutil.copyfile(mailbox_template, db_path)
+        return MailboxManager(db_path)
+    
+    return make
+
+
+@pytest.fixture
+def mem_mailbox():
+    """In-memory mailbox for tests that do not need the database on disk."""
+    with MailboxManager(":memory:") as mailbox:
+        yield mailbox
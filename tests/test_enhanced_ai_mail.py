@@ -27,6 +27,17 @@ from ai_mail_mcp.agent import AgentIdentifier
 from ai_mail_mcp.monitor import SystemMonitor
 
 
+@pytest.fixture
+def enhanced_mailbox():
+    """Create enhanced mailbox with performance monitoring."""
+    with tempfile.TemporaryDirectory() as temp_dir, \
+            MailboxManager(Path(temp_dir) / "enhanced_test.db") as mailbox:
+        # The concurrency tests rely on WAL and on waiting out locks, not failing
+        assert mailbox.db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert mailbox.db.execute("PRAGMA busy_timeout").fetchone()[0] == 30000
+        yield mailbox
+
+
 class TestEnhancedMessage:
     """Enhanced tests for Message model with edge cases."""
     
@@ -77,131 +88,130 @@ class TestEnhancedMessage:
             read=True
         )
         
-        # Convert to dict (simulating JSON serialization)
-        msg_dict = {
-            "id": msg.id,
-            "sender": msg.sender,
-            "recipient": msg.recipient,
-            "subject": msg.subject,
-            "body": msg.body,
-            "timestamp": msg.timestamp.isoformat(),
-            "priority": msg.priority,
-            "tags": msg.tags,
-            "read": msg.read,
-            "reply_to": msg.reply_to,
-            "thread_id": msg.thread_id
-        }
+        blob = msg.to_json()
+        assert isinstance(blob, bytes)
         
-        # Reconstruct from dict
-        reconstructed = Message(
-            id=msg_dict["id"],
-            sender=msg_dict["sender"],
-            recipient=msg_dict["recipient"],
-            subject=msg_dict["subject"],
-            body=msg_dict["body"],
-            timestamp=datetime.fromisoformat(msg_dict["timestamp"].replace('Z', '+00:00')),
-            priority=msg_dict["priority"],
-            tags=msg_dict["tags"],
-            read=msg_dict["read"],
-            reply_to=msg_dict["reply_to"],
-            thread_id=msg_dict["thread_id"]
-        )
+        reconstructed = Message.from_json(blob)
+        assert reconstructed == msg
+        assert reconstructed.timestamp.tzinfo is not None
         
-        assert reconstructed.id == msg.id
-        assert reconstructed.subject == msg.subject
-        assert reconstructed.priority == msg.priority
+        # Non-ASCII content survives as UTF-8
+        unicode_msg = msg.model_copy(update={"body": "héllo 世界 🚀" * 1000})
+        assert Message.from_json(unicode_msg.to_json()).body == unicode_msg.body
 
 
 class TestEnhancedMailboxManager:
     """Enhanced tests for MailboxManager with stress testing and edge cases."""
     
-    @pytest.fixture
-    def enhanced_mailbox(self):
-        """Create enhanced mailbox with performance monitoring."""
-        with tempfile.TemporaryDirectory() as temp_dir:
-            db_path = Path(temp_dir) / "enhanced_test.db"
-            mailbox = MailboxManager(db_path)
-            yield mailbox
-    
-    def test_bulk_message_insertion_performance(self, enhanced_mailbox):
+    def test_bulk_message_insertion_performance(self, mem_mailbox):
         """Test bulk message insertion performance."""
-        start_time = time.time()
+        base_ts = datetime.now(timezone.utc)
+        second = timedelta(seconds=1)
+        start_ns = time.perf_counter_ns()
         
-        # Insert 1000 messages
-        messages = []
-        for i in range(1000):
-            msg = Message(
+        # Insert 1000 messages in one transaction
+        messages = [
+            Message(
                 id=f"bulk-{i:04d}",
                 sender=f"sender-{i % 10}",
                 recipient="test-recipient",
                 subject=f"Bulk Message {i}",
                 body=f"Content for bulk message {i}" * 10,  # ~250 chars
-                timestamp=datetime.now(timezone.utc) - timedelta(seconds=i),
+                timestamp=base_ts - i * second,
                 priority=["urgent", "high", "normal", "low"][i % 4],
                 tags=[f"tag-{i % 5}", f"category-{i % 3}"]
             )
-            messages.append(msg)
-            enhanced_mailbox.send_message(msg)
+            for i in range(1000)
+        ]
+        mem_mailbox.send_messages_bulk(messages)
         
-        insertion_time = time.time() - start_time
+        insertion_time = (time.perf_counter_ns() - start_ns) / 1e9
         
         # Verify all messages were inserted
-        retrieved = enhanced_mailbox.get_messages("test-recipient", unread_only=False, limit=1000)
+        retrieved = mem_mailbox.get_messages("test-recipient", unread_only=False, limit=1000)
         assert len(retrieved) == 1000
         
         # Performance check: should insert 1000 messages in under 5 seconds
         assert insertion_time < 5.0
         
-        # Throughput should be at least 200 messages per second
+        # Throughput should be at least 5000 messages per second
         throughput = 1000 / insertion_time
-        assert throughput > 200
+        assert throughput > 5000
     
     def test_concurrent_database_access(self, enhanced_mailbox):
         """Test concurrent database access with threading."""
         import threading
-        import queue
         
         num_threads = 10
         messages_per_thread = 50
-        results = queue.Queue()
+        # One slot per worker, so workers never contend to report
+        results = [None] * num_threads
+        # Workers and the timer start together, after every thread is up
+        start = threading.Barrier(num_threads + 1)
+        base_ts = datetime.now(timezone.utc)
+        
+        # Every thread's rows, column by column, built before any thread starts
+        # so the threads spend their time in SQLite
+        columns = [
+            (
+                [f"concurrent-{thread_id}-{i}" for i in range(messages_per_thread)],
+                [f"thread-{thread_id}"] * messages_per_thread,
+                ["concurrent-recipient"] * messages_per_thread,
+                [f"Concurrent Message {i} from Thread {thread_id}" for i in range(messages_per_thread)],
+                [f"Thread {thread_id} message {i}" for i in range(messages_per_thread)],
+                [base_ts] * messages_per_thread,
+            )
+            for thread_id in range(num_threads)
+        ]
         
         def worker(thread_id):
+            start.wait()
             try:
-                for i in range(messages_per_thread):
-                    msg = Message(
-                        id=f"concurrent-{thread_id}-{i}",
-                        sender=f"thread-{thread_id}",
-                        recipient="concurrent-recipient",
-                        subject=f"Concurrent Message {i} from Thread {thread_id}",
-                        body=f"Thread {thread_id} message {i}",
-                        timestamp=datetime.now(timezone.utc)
-                    )
-                    enhanced_mailbox.send_message(msg)
-                results.put(("success", thread_id, messages_per_thread))
+                enhanced_mailbox.send_message_rows(*columns[thread_id])
+                results[thread_id] = ("success", thread_id, messages_per_thread)
             except Exception as e:
-                results.put(("error", thread_id, str(e)))
+                results[thread_id] = ("error", thread_id, str(e))
+        
+        writing = threading.Event()
+        writing.set()
+        read_errors = []
+        
+        def reader():
+            # Readers use their own connections and must not wait on, or fail
+            # because of, the writers
+            try:
+                while writing.is_set():
+                    enhanced_mailbox.get_messages("concurrent-recipient", unread_only=False, limit=50)
+            except Exception as e:
+                read_errors.append(str(e))
         
         # Start threads
         threads = []
-        start_time = time.time()
+        readers = [threading.Thread(target=reader) for _ in range(3)]
         
+        for thread in readers:
+            thread.start()
         for i in range(num_threads):
             thread = threading.Thread(target=worker, args=(i,))
             threads.append(thread)
             thread.start()
+        start.wait()
+        start_ns = time.perf_counter_ns()
         
         # Wait for completion
         for thread in threads:
             thread.join()
-        
-        execution_time = time.time() - start_time
+        execution_time = (time.perf_counter_ns() - start_ns) / 1e9
+        writing.clear()
+        for thread in readers:
+            thread.join()
+        assert read_errors == []
         
         # Collect results
         successful_threads = 0
         total_messages = 0
         
-        while not results.empty():
-            status, thread_id, count = results.get()
+        for status, thread_id, count in results:
             if status == "success":
                 successful_threads += 1
                 total_messages += count
@@ -231,35 +241,37 @@ class TestEnhancedMailboxManager:
             )
             enhanced_mailbox.send_message(msg)
         
-        # Simulate database issues by closing connection
-        enhanced_mailbox.db.close()
+        # Simulate database issues by closing its connections
+        enhanced_mailbox.close()
         
         # Try to perform operations (should handle gracefully)
         with pytest.raises((sqlite3.OperationalError, sqlite3.ProgrammingError)):
             enhanced_mailbox.get_messages("test-recipient")
     
-    def test_message_search_performance(self, enhanced_mailbox):
+    def test_message_search_performance(self, mem_mailbox):
         """Test search performance with large dataset."""
         # Create diverse message set
         keywords = ["urgent", "project", "meeting", "deadline", "report", "review", "update", "task"]
+        base_ts = datetime.now(timezone.utc)
+        hour = timedelta(hours=1)
         
-        for i in range(500):
-            keyword = keywords[i % len(keywords)]
-            msg = Message(
+        mem_mailbox.send_messages_bulk(
+            Message(
                 id=f"search-{i:03d}",
                 sender=f"user-{i % 20}",
                 recipient="search-recipient",
-                subject=f"Message about {keyword} #{i}",
-                body=f"This message discusses {keyword} and related topics. Message number {i}.",
-                timestamp=datetime.now(timezone.utc) - timedelta(hours=i),
-                tags=[keyword, f"batch-{i // 50}"]
+                subject=f"Message about {keywords[i % len(keywords)]} #{i}",
+                body=f"This message discusses {keywords[i % len(keywords)]} and related topics. Message number {i}.",
+                timestamp=base_ts - i * hour,
+                tags=[keywords[i % len(keywords)], f"batch-{i // 50}"]
             )
-            enhanced_mailbox.send_message(msg)
+            for i in range(500)
+        )
         
         # Test search performance
-        start_time = time.time()
-        results = enhanced_mailbox.search_messages("search-recipient", "urgent")
-        search_time = time.time() - start_time
+        start_ns = time.perf_counter_ns()
+        results = mem_mailbox.search_messages("search-recipient", "urgent", limit=100)
+        search_time = (time.perf_counter_ns() - start_ns) / 1e9
         
         # Should find approximately 62-63 messages (500/8 keywords)
         assert 50 <= len(results) <= 80
@@ -273,36 +285,39 @@ class TestEnhancedMailboxManager:
     
     def test_memory_usage_monitoring(self, enhanced_mailbox):
         """Test memory usage during operations."""
-        import psutil
-        import os
-        
-        process = psutil.Process(os.getpid())
-        initial_memory = process.memory_info().rss
-        
-        # Perform memory-intensive operations
-        large_messages = []
-        for i in range(100):
-            large_content = "Large message content " * 1000  # ~20KB per message
-            msg = Message(
-                id=f"memory-{i}",
-                sender="memory-test",
-                recipient="memory-recipient",
-                subject=f"Large Message {i}",
-                body=large_content,
-                timestamp=datetime.now(timezone.utc)
-            )
-            enhanced_mailbox.send_message(msg)
-            large_messages.append(msg)
+        import tracemalloc
         
-        # Check memory after operations
-        peak_memory = process.memory_info().rss
-        memory_increase = peak_memory - initial_memory
+        # Counts only what this test allocates, not the interpreter or pytest
+        tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            
+            # Perform memory-intensive operations
+            large_messages = []
+            for i in range(100):
+                large_content = "Large message content " * 1000  # ~20KB per message
+                msg = Message(
+                    id=f"memory-{i}",
+                    sender="memory-test",
+                    recipient="memory-recipient",
+                    subject=f"Large Message {i}",
+                    body=large_content,
+                    timestamp=datetime.now(timezone.utc)
+                )
+                enhanced_mailbox.send_message(msg)
+                large_messages.append(msg)
+            
+            # Check memory after operations
+            after = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        memory_increase = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
         
         # Clear references
         large_messages.clear()
         
-        # Memory increase should be reasonable (less than 100MB)
-        assert memory_increase < 100 * 1024 * 1024
+        # ~2 MB of bodies; memory increase should stay well under 40MB
+        assert memory_increase < 40 * 1024 * 1024
     
     def test_transaction_rollback(self, enhanced_mailbox):
         """Test database transaction rollback on errors."""
@@ -333,17 +348,36 @@ class TestEnhancedMailboxManager:
             )
             enhanced_mailbox.send_message(duplicate_msg)
         
+        # Tagged sends take two statements in a BEGIN IMMEDIATE transaction,
+        # which must be rolled back as a whole
+        with pytest.raises(sqlite3.IntegrityError):
+            enhanced_mailbox.send_message(Message(
+                id="rollback-1",  # Duplicate ID
+                sender="test-sender",
+                recipient="test-recipient",
+                subject="Duplicate Tagged Message",
+                body="Should fail",
+                timestamp=datetime.now(timezone.utc),
+                tags=["rollback"]
+            ))
+        
         # Count should remain the same (rollback occurred)
         final_count = len(enhanced_mailbox.get_messages("test-recipient", unread_only=False))
         assert final_count == initial_count
+        assert enhanced_mailbox.get_message_previews("test-recipient", tag="rollback") == []
+        
+        # Nothing is left open: a checkpoint on the writer is not blocked
+        assert not enhanced_mailbox.db.in_transaction
+        assert enhanced_mailbox.db.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()[0] == 0
 
 
 class TestEnhancedAgentIdentifier:
     """Enhanced tests for AgentIdentifier with edge cases."""
     
-    @patch('ai_mail_mcp.agent.psutil')
-    def test_complex_process_detection(self, mock_psutil):
+    @patch('ai_mail_mcp.agent._get_psutil')
+    def test_complex_process_detection(self, get_psutil):
         """Test complex process hierarchy detection."""
+        mock_psutil = get_psutil.return_value
         # Create mock process hierarchy
         mock_grandparent = Mock()
         mock_grandparent.name.return_value = 'explorer.exe'
@@ -380,25 +414,31 @@ class TestEnhancedAgentIdentifier:
             else:
                 assert unique_name == f"{base_name}-{i + 2}"
     
-    @pytest.mark.parametrize("test_name,expected_valid", [
-        ("valid-agent", True),
-        ("agent_with_underscores", True),
-        ("agent.with.dots", True),
-        ("agent123", True),
-        ("", False),
-        ("a", False),  # Too short
-        ("x" * 100, False),  # Too long
-        ("-starts-with-dash", False),
-        ("ends-with-dash-", False),
-        ("has spaces", False),
-        ("has@symbols", False),
-        ("has\nnewlines", False),
-        ("has\ttabs", False),
-    ])
-    def test_agent_name_validation_comprehensive(self, test_name, expected_valid):
+    def test_agent_name_validation_comprehensive(self):
         """Comprehensive agent name validation testing."""
-        is_valid = AgentIdentifier.validate_agent_name(test_name)
-        assert is_valid == expected_valid
+        cases = [
+            ("valid-agent", True),
+            ("agent_with_underscores", True),
+            ("agent.with.dots", True),
+            ("agent123", True),
+            ("", False),
+            ("a", False),  # Too short
+            ("x" * 100, False),  # Too long
+            ("-starts-with-dash", False),
+            ("ends-with-dash-", False),
+            ("has spaces", False),
+            ("has@symbols", False),
+            ("has\nnewlines", False),
+            ("has\ttabs", False),
+        ]
+        
+        # validate_agent_name is pure, so one test checks every case and
+        # reports all the mismatches together
+        mismatches = [
+            (name, expected) for name, expected in cases
+            if AgentIdentifier.validate_agent_name(name) is not expected
+        ]
+        assert not mismatches, f"expected validity differs for: {mismatches!r}"
     
     def test_agent_suggestion_algorithm(self):
         """Test agent name suggestion algorithm."""
@@ -548,6 +588,7 @@ class TestEdgeCasesAndErrorHandling:
             db_path = Path(temp_dir) / "timezone_test.db"
             mailbox = MailboxManager(db_path)
             
+            sent = {}
             for i, tz in enumerate(timezones):
                 msg = Message(
                     id=f"tz-{i}",
@@ -558,14 +599,22 @@ class TestEdgeCasesAndErrorHandling:
                     timestamp=datetime.now(tz)
                 )
                 mailbox.send_message(msg)
+                sent[msg.id] = msg.timestamp
+            
+            # Stored as integer microseconds since the epoch, not text
+            types = mailbox.db.execute("SELECT DISTINCT typeof(timestamp) FROM messages").fetchall()
+            assert [row[0] for row in types] == ["integer"]
             
             # Retrieve and verify timestamps are preserved
             messages = mailbox.get_messages("tz-recipient", unread_only=False)
             assert len(messages) == len(timezones)
             
-            # All timestamps should be timezone-aware
+            # The same instants come back, timezone-aware and converted to UTC
             for message in messages:
                 assert message.timestamp.tzinfo is not None
+                assert message.timestamp.utcoffset() == timedelta(0)
+                assert message.timestamp == sent[message.id]
+            mailbox.close()
 
 
 @pytest.mark.integration
@@ -674,70 +723,70 @@ class TestFullSystemIntegration:
 class TestPerformanceBenchmarks:
     """Performance benchmark tests."""
     
-    def test_message_throughput_benchmark(self):
+    def test_message_throughput_benchmark(self, mem_mailbox):
         """Benchmark message processing throughput."""
-        with tempfile.TemporaryDirectory() as temp_dir:
-            db_path = Path(temp_dir) / "benchmark.db"
-            mailbox = MailboxManager(db_path)
-            
-            # Benchmark parameters
-            num_messages = 1000
-            num_recipients = 10
-            
-            # Warm up
-            for i in range(10):
-                msg = Message(
-                    id=f"warmup-{i}",
-                    sender="benchmark-sender",
-                    recipient="warmup-recipient",
-                    subject="Warmup",
-                    body="Warmup message",
-                    timestamp=datetime.now(timezone.utc)
-                )
-                mailbox.send_message(msg)
-            
-            # Actual benchmark
-            start_time = time.time()
-            
-            for i in range(num_messages):
-                recipient = f"recipient-{i % num_recipients}"
-                msg = Message(
-                    id=f"benchmark-{i:04d}",
-                    sender="benchmark-sender",
-                    recipient=recipient,
-                    subject=f"Benchmark Message {i}",
-                    body=f"This is benchmark message number {i} with some content to make it realistic.",
-                    timestamp=datetime.now(timezone.utc),
-                    priority=["urgent", "high", "normal", "low"][i % 4],
-                    tags=[f"tag-{i % 5}", "benchmark"]
-                )
-                mailbox.send_message(msg)
-            
-            send_time = time.time() - start_time
-            
-            # Benchmark retrieval
-            start_time = time.time()
-            for i in range(num_recipients):
-                recipient = f"recipient-{i}"
-                messages = mailbox.get_messages(recipient, unread_only=False, limit=200)
-            
-            retrieve_time = time.time() - start_time
-            
-            # Calculate metrics
-            send_throughput = num_messages / send_time
-            retrieve_throughput = (num_recipients * 200) / retrieve_time
-            
-            print(f"\nPerformance Benchmark Results:")
-            print(f"Send throughput: {send_throughput:.2f} messages/second")
-            print(f"Retrieve throughput: {retrieve_throughput:.2f} messages/second")
-            print(f"Total send time: {send_time:.3f} seconds")
-            print(f"Total retrieve time: {retrieve_time:.3f} seconds")
-            
-            # Performance assertions
-            assert send_throughput > 500  # At least 500 messages/second
-            assert retrieve_throughput > 1000  # At least 1000 messages/second
-            assert send_time < 5.0  # Should complete within 5 seconds
-            assert retrieve_time < 2.0  # Should complete within 2 seconds
+        mailbox = mem_mailbox
+        
+        # Benchmark parameters
+        num_messages = 1000
+        num_recipients = 10
+        base_ts = datetime.now(timezone.utc)
+        
+        # Warm up
+        for i in range(10):
+            msg = Message(
+                id=f"warmup-{i}",
+                sender="benchmark-sender",
+                recipient="warmup-recipient",
+                subject="Warmup",
+                body="Warmup message",
+                timestamp=base_ts
+            )
+            mailbox.send_message(msg)
+        
+        # Actual benchmark
+        start_ns = time.perf_counter_ns()
+        
+        messages = [
+            Message(
+                id=f"benchmark-{i:04d}",
+                sender="benchmark-sender",
+                recipient=f"recipient-{i % num_recipients}",
+                subject=f"Benchmark Message {i}",
+                body=f"This is benchmark message number {i} with some content to make it realistic.",
+                timestamp=base_ts,
+                priority=["urgent", "high", "normal", "low"][i % 4],
+                tags=[f"tag-{i % 5}", "benchmark"]
+            )
+            for i in range(num_messages)
+        ]
+        mailbox.send_messages_bulk(messages)
+        
+        send_time = (time.perf_counter_ns() - start_ns) / 1e9
+        
+        # Benchmark retrieval
+        start_ns = time.perf_counter_ns()
+        for i in range(num_recipients):
+            recipient = f"recipient-{i}"
+            messages = mailbox.get_messages(recipient, unread_only=False, limit=200)
+        
+        retrieve_time = (time.perf_counter_ns() - start_ns) / 1e9
+        
+        # Calculate metrics
+        send_throughput = num_messages / send_time
+        retrieve_throughput = (num_recipients * 200) / retrieve_time
+        
+        print(f"\nPerformance Benchmark Results:")
+        print(f"Send throughput: {send_throughput:.2f} messages/second")
+        print(f"Retrieve throughput: {retrieve_throughput:.2f} messages/second")
+        print(f"Total send time: {send_time:.3f} seconds")
+        print(f"Total retrieve time: {retrieve_time:.3f} seconds")
+        
+        # Performance assertions
+        assert send_throughput > 10000  # At least 10000 messages/second
+        assert retrieve_throughput > 50000  # At least 50000 messages/second
+        assert send_time < 5.0  # Should complete within 5 seconds
+        assert retrieve_time < 2.0  # Should complete within 2 seconds
 
 
 if __name__ == "__main__":